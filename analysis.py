@@ -0,0 +1,980 @@
+#!/usr/bin/env python
+"""
+Response time analysis of measured RTFM tasks
+
+Everything here is plain python and does not need gdb or a target, so a
+trace written by gdb.py can be analysed offline:
+
+    python analysis.py wcet_trace.bin
+    python analysis.py wcet_trace.bin --interarrival 100 40 50
+    python analysis.py wcet_trace.bin --sweep candidates.txt
+"""
+import argparse
+import bisect
+import collections
+import enum
+import heapq
+import math
+import mmap
+import multiprocessing
+import struct
+import sys
+from array import array
+from fractions import Fraction
+
+import rta
+import simulate
+
+
+class Action(enum.IntEnum):
+    """ Event kinds, named as in the printed claims """
+    Start = 0
+    Enter = 1
+    Exit = 2
+    Finish = 3
+
+
+class EventStore:
+    """
+    Columnar store of the measured events
+
+    Test and task names are interned to small ids, every event takes a fixed
+    number of bytes in the typed columns:
+
+    test (id), task (id), cycles, level (priority/ceiling), action (code)
+
+    Indexing and iteration give the old output data rows
+    [test, task, cycles, level, action name], so code written against the
+    list of lists keeps working.
+    """
+
+    def __init__(self):
+        self.tests = []
+        self.tasks = []
+        self.__test_ids = {}
+        self.__task_ids = {}
+        self.test = array('I')
+        self.task = array('H')
+        self.cycles = array('Q')
+        self.level = array('H')
+        self.action = array('B')
+
+    @staticmethod
+    def __intern(names, ids, name):
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    def test_id(self, name):
+        return self.__intern(self.tests, self.__test_ids, name)
+
+    def task_id(self, name):
+        return self.__intern(self.tasks, self.__task_ids, name)
+
+    def append(self, test, task, cycles, level, action):
+        self.test.append(self.test_id(test))
+        self.task.append(self.task_id(task))
+        self.cycles.append(cycles)
+        self.level.append(int(level))
+        self.action.append(action)
+
+    def __len__(self):
+        return len(self.action)
+
+    def __getitem__(self, index):
+        return [self.tests[self.test[index]], self.tasks[self.task[index]],
+                self.cycles[index], self.level[index],
+                Action(self.action[index]).name]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+""" Binary trace file, 16 byte header followed by 16 byte records """
+TRACE_MAGIC = b'RTFMTRCE'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<8sII')
+""" action, level, task id, test id, cycles delta to the previous event """
+TRACE_RECORD = struct.Struct('<BBHIq')
+""" Name record, level 0/1 for a test/task name, delta is the name length """
+TRACE_NAME = 0xff
+
+
+class TraceWriter:
+    """
+    Streams events to a binary trace file as they are produced
+
+    Every event is one fixed size record, with the cycle count stored as
+    the difference to the previous event. Test and task names are written
+    once, as a name record followed by the name padded to a full record.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__file = open(path, 'wb')
+        self.__file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, 0))
+        self.__ids = ({}, {})
+        self.__cycles = 0
+
+    def __name_id(self, kind, name):
+        ids = self.__ids[kind]
+        if name not in ids:
+            ids[name] = len(ids)
+            data = name.encode('UTF-8')
+            padding = -len(data) % TRACE_RECORD.size
+            self.__file.write(TRACE_RECORD.pack(
+                TRACE_NAME, kind, 0, ids[name], len(data)))
+            self.__file.write(data + b'\0' * padding)
+        return ids[name]
+
+    def append(self, test, task, cycles, level, action):
+        test_id = self.__name_id(0, test)
+        task_id = self.__name_id(1, task)
+        self.__file.write(TRACE_RECORD.pack(
+            action, int(level), task_id, test_id, cycles - self.__cycles))
+        self.__cycles = cycles
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+class TraceReader:
+    """
+    Memory maps a trace file written by TraceWriter
+
+    Iterating gives (test, task, cycles, level, action) tuples, load() reads
+    the whole trace into an EventStore.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _ = TRACE_HEADER.unpack_from(self.__map, 0)
+        if magic != TRACE_MAGIC or version > TRACE_VERSION:
+            raise ValueError("%s is not a trace file" % path)
+
+    def __iter__(self):
+        names = ([], [])
+        cycles = 0
+        pos = TRACE_HEADER.size
+        end = len(self.__map) - TRACE_RECORD.size
+        while pos <= end:
+            action, level, task_id, test_id, delta = TRACE_RECORD.unpack_from(
+                self.__map, pos)
+            pos += TRACE_RECORD.size
+            if action == TRACE_NAME:
+                names[level].append(
+                    self.__map[pos:pos + delta].decode('UTF-8'))
+                pos += delta + (-delta % TRACE_RECORD.size)
+            else:
+                cycles += delta
+                yield (names[0][test_id], names[1][task_id], cycles, level,
+                       Action(action))
+
+    def load(self):
+        store = EventStore()
+        for event in self:
+            store.append(*event)
+        return store
+
+    def close(self):
+        self.__map.close()
+
+
+class Aggregator:
+    """
+    Running maxima over the measured events, updated in O(1) per event
+
+    wcet    task -> longest Finish time over all tests
+    claims  (task, ceiling) -> longest critical section at that ceiling
+
+    Enter/Exit are paired through a stack of open claims per test, so any
+    nesting of critical sections is handled.
+    """
+
+    def __init__(self):
+        self.wcet = {}
+        self.claims = {}
+        self.__open = {}
+
+    def append(self, test, task, cycles, level, action):
+        if action == Action.Start:
+            self.__open[test] = []
+        elif action == Action.Enter:
+            self.__open.setdefault(test, []).append((level, cycles))
+        elif action == Action.Exit:
+            stack = self.__open.get(test)
+            if stack:
+                ceiling, enter = stack.pop()
+                key = (task, ceiling)
+                hold = cycles - enter
+                if hold > self.claims.get(key, -1):
+                    self.claims[key] = hold
+        elif action == Action.Finish:
+            self.__open.pop(test, None)
+            if not cycles == 0 and cycles > self.wcet.get(task, -1):
+                self.wcet[task] = cycles
+
+
+class BlockingIndex:
+    """
+    Blocking time per priority level, from the (task, ceiling) -> hold
+    index of an Aggregator
+
+    Under SRP a critical section of a task at priority p with ceiling c
+    blocks every task with a priority in p+1..c. The maximum over these
+    ranges is piecewise constant in the priority, so it is swept once into
+    breakpoints and each lookup is a binary search.
+    """
+
+    def __init__(self, claims, task_priorities):
+        ranges = []
+        for (task, ceiling), hold in claims.items():
+            if task in task_priorities and ceiling > task_priorities[task]:
+                ranges.append((task_priorities[task] + 1, ceiling, hold))
+        ranges.sort()
+
+        self.points = sorted(set([lo for (lo, hi, hold) in ranges] +
+                                 [hi + 1 for (lo, hi, hold) in ranges]))
+        self.values = []
+        active = []
+        index = 0
+        for point in self.points:
+            while index < len(ranges) and ranges[index][0] <= point:
+                lo, hi, hold = ranges[index]
+                heapq.heappush(active, (-hold, hi))
+                index += 1
+            while active and active[0][1] < point:
+                heapq.heappop(active)
+            self.values.append(-active[0][0] if active else 0)
+
+    def __call__(self, priority):
+        index = bisect.bisect_right(self.points, priority) - 1
+        if index < 0:
+            return 0
+        return self.values[index]
+
+
+def aggregate(outputdata):
+    """ Aggregate stored events (or rows of output data) in one pass """
+    aggregator = Aggregator()
+    for obj in outputdata:
+        aggregator.append(obj[0], obj[1], obj[2], int(obj[3]),
+                          Action[obj[4]])
+    return aggregator
+
+
+def tasklist_get(path='klee/tasks.txt'):
+    """ Parse the automatically generated tasklist
+    """
+
+    with open(path) as fin:
+        for line in fin:
+                # print(line)
+            if not line == "// autogenerated file\n":
+                return [x.strip().strip("[]\"").split(' ')
+                        for x in line.split(',')]
+
+
+def tasklist_model(task_list):
+    """
+    Split the tasklist into tasks, priorities, interarrivals, deadlines and
+    release jitters
+
+    Each entry is "task priority interarrival [deadline [jitter]]", the
+    deadline defaults to the interarrival and the jitter to 0.
+    """
+    tasks = []
+    priorities = []
+    interarrival = []
+    deadlines = []
+    jitter = []
+    for x in task_list:
+        tasks.append(x[0])
+        priorities.append(x[1])
+        interarrival.append(x[2])
+        deadlines.append(x[3] if len(x) > 3 else x[2])
+        jitter.append(x[4] if len(x) > 4 else '0')
+    return tasks, priorities, interarrival, deadlines, jitter
+
+
+def print_claims(outputdata):
+    """
+    Print all events, with the claim time at each Exit (paired with its
+    Enter through a stack per test) and the total time at each Finish
+    """
+    open_claims = {}
+    print("Claims:")
+    for obj in outputdata:
+        if obj[4] == "Enter":
+            open_claims.setdefault(obj[0], []).append(obj[2])
+            print("%s" % (obj))
+        elif obj[4] == "Exit" and open_claims.get(obj[0]):
+            claim_time = obj[2] - open_claims[obj[0]].pop()
+            print("%s Claim time: %s" % (obj, claim_time))
+        elif obj[4] == "Finish" and not obj[2] == 0:
+            open_claims.pop(obj[0], None)
+            tot_time = obj[2]
+            print("%s Total time: %s" % (obj, tot_time))
+        else:
+            print("%s" % (obj))
+
+
+def compute_cpu_demand(aggregator, tasks, priorities, interarrival):
+    utilization = 0
+    task_array = []
+
+    #Create list of dictionaries with key:value pairs for task name, task demand, task interarrival
+    for index, t in enumerate(tasks):
+        data = {'name': t, 'demand': 0, 'interarrival': interarrival[index]}
+        task_array.append(data)
+    newlist = sorted(task_array, key=lambda k: k['name']) 
+    
+    #Update task total time
+    for i, entry in enumerate(newlist):
+        entry['demand'] = aggregator.wcet.get(entry['name'], 0)
+    print("\nComputed CPU Demand (Assignment 2):")
+
+    #Print computed CPU demand and calculcate total utilization
+    for i, entry in enumerate(newlist):
+        print("%s = %s/%s" % (entry['name'], entry['demand'], entry['interarrival']))
+        utilization += int(entry['demand'])/int(entry['interarrival'])
+    print("------------")
+    print("sum = %s" % (utilization))
+
+    # EXTI1 = 37/100
+    # EXTI2 = 12/30
+    # EXTI3 = 8/40
+    # ------------
+    # sum   = 0.97
+
+def response_time_algorithm(aggregator, tasks, priorities, interarrival,
+                            deadlines=None, jitter=None):
+    task_array = []
+
+    #Create list of dictionaries with key:value pairs for task name, c_time, b_time, i_time, priority, interarrival, deadline and jitter
+    for index, t in enumerate(tasks):
+        data = {'name': t, 'c_time': 0, 'b_time': 0, 'i_time': 0, 'priority': priorities[index], 'interarrival': interarrival[index],
+                'deadline': deadlines[index] if deadlines else interarrival[index], 'jitter': jitter[index] if jitter else 0}
+        task_array.append(data)
+    newlist = sorted(task_array, key=lambda k: k['name']) 
+
+    #Name, Priority, Interarrival is already known and inserted, but we need c_time, b_time and i_time!
+    
+    #Find WCET (c_time) and Blocked time (b_time) for each task
+    blocking = BlockingIndex(aggregator.claims, {t: int(priorities[index]) for index, t in enumerate(tasks)})
+    for i, entry in enumerate(newlist):
+        entry['c_time'] = aggregator.wcet.get(entry['name'], 0)
+        entry['b_time'] = blocking(int(entry['priority']))
+
+    #Calculate Interference time (i_time) for each task
+    for i, entry in enumerate(newlist):
+        p_temp = int(entry['priority'])
+        i_temp = int(entry['deadline'])
+        for j, entry2 in enumerate(newlist):
+            if p_temp < int(entry2['priority']):
+                i2_temp = int(entry2['interarrival'])
+                #Jobs released (with jitter) until the deadline
+                multiplier = math.ceil((i_temp + int(entry2['jitter']))/i2_temp)
+                entry['i_time'] += (multiplier * int(entry2['c_time']))
+
+    #Calculate and Print response times
+    print("\nCalculated Response Times (Assignment 3):")
+    for i, entry in enumerate(newlist):
+        print("R_%s = %s (C: %s - B: %s - I: %s)" % (entry['name'], (entry['c_time'] + entry['b_time'] + entry['i_time'] + int(entry['jitter'])), entry['c_time'], entry['b_time'], entry['i_time']))
+
+    #R_EXTI1 = 109 (C: 37 - B: 0 - I: 72)
+    #R_EXTI2 = 22 (C: 12 - B: 10 - I: 0)
+    #R_EXTI3 = 47 (C: 8 - B: 15 - I: 24)
+
+def recursive_response_algorithm(aggregator, tasks, priorities,
+                                 interarrival, deadlines=None, jitter=None):
+    task_array = []
+
+    #Create list of dictionaries with key:value pairs for task name, r_time, c_time, b_time, i_time, priority, interarrival, deadline and jitter
+    for index, t in enumerate(tasks):
+        data = {'name': t, 'r_time': 0, 'c_time': 0, 'b_time': 0, 'i_time': 0, 'priority': priorities[index], 'interarrival': interarrival[index], 'missed': False,
+                'deadline': deadlines[index] if deadlines else interarrival[index], 'jitter': jitter[index] if jitter else 0}
+        task_array.append(data)
+    newlist = sorted(task_array, key=lambda k: k['priority'], reverse=True) 
+
+    #Name, Priority, Interarrival is already known and inserted, but we need r_time, c_time, b_time and i_time!
+    
+    #Find WCET (c_time) and Blocked time (b_time) for each task
+    blocking = BlockingIndex(aggregator.claims, {t: int(priorities[index]) for index, t in enumerate(tasks)})
+    for i, entry in enumerate(newlist):
+        entry['c_time'] = aggregator.wcet.get(entry['name'], 0)
+        entry['b_time'] = blocking(int(entry['priority']))
+
+    #Calculate Interference time (i_time) for each task
+    for i, entry in enumerate(newlist):
+        r_temp = int(entry['c_time']) + int(entry['b_time'])
+        looparray = [] #This array holds all the tasks with higher priority than task i
+
+        #Highest priority task
+        if i == 0:
+            entry['r_time'] = int(entry['c_time'] + int(entry['b_time'])) + int(entry['jitter'])
+
+        #Everything below highest priority task
+        else:
+
+            #Add all tasks with higher priorty than task i to the loop array
+            for j, entry2 in enumerate(newlist):
+                if j < i:
+                    #print("%s has higher priority than %s" % (entry2['name'], entry['name']))
+                    looparray.append(entry2)
+
+            #Iterate until the response time itself stops changing, there is no
+            #fixpoint if the higher priority tasks use the whole cpu, then stop
+            #once the deadline is passed
+            saturated = sum(Fraction(int(item['c_time']), int(item['interarrival'])) for item in looparray) >= 1
+            r_prev = -1
+            while r_temp != r_prev:
+                i_total = 0
+                r_prev = r_temp
+                #Loop through every item in the loop array and perform the calculations
+                for item in looparray:
+                    i_total += (math.ceil((r_temp + int(item['jitter']))/int(item['interarrival']))* item['c_time'])
+                r_temp = int(entry['c_time']) + int(entry['b_time'])+ i_total
+                if saturated and r_temp + int(entry['jitter']) > int(entry['deadline']):
+                    break
+            entry['r_time'] = r_temp + int(entry['jitter'])
+            entry['i_time'] = i_total
+        if int(entry['r_time']) > int(entry['deadline']):
+            entry['missed'] = True
+
+    #Calculate and Print response times
+    print("\nCalculated Response Times (Assignment 4):")
+    #Resort the list back to sorted by name, instead of priority for printing purposes
+    printlist = sorted(newlist, key=lambda k: k['name']) 
+    for i, entry in enumerate(printlist):
+        #If Deadline is missed
+        if entry['missed'] == True:
+            print("R_%s = %s (C: %s - B: %s - I: %s) - MISSED DEADLINE" % (entry['name'], entry['r_time'], entry['c_time'], entry['b_time'], entry['i_time']))
+        #If Deadline is not missed
+        else:
+            print("R_%s = %s (C: %s - B: %s - I: %s)" % (entry['name'], entry['r_time'], entry['c_time'], entry['b_time'], entry['i_time']))
+
+    #interarrivals[100,30,40]
+    #Calculated Response Times:
+    #R_EXTI1 = 109 (C: 37 - B: 0 - I: 40) - MISSED DEADLINE
+    #R_EXTI2 = 22 (C: 12 - B: 10 - I: 0)
+    #R_EXTI3 = 47 (C: 8 - B: 15 - I: 12) - MISSED DEADLINE 
+
+    #interarrivals[100,40,50]
+    #Calculated Response Times:
+    #R_EXTI1 = 77 (C: 37 - B: 0 - I: 40)
+    #R_EXTI2 = 22 (C: 12 - B: 10 - I: 0)
+    #R_EXTI3 = 35 (C: 8 - B: 15 - I: 12)
+
+    #interarrivals[80,30,40]
+    #Calculated Response Times:
+    #R_EXTI1 = 109 (C: 37 - B: 0 - I: 72) - MISSED DEADLINE
+    #R_EXTI2 = 22 (C: 12 - B: 10 - I: 0)
+    #R_EXTI3 = 47 (C: 8 - B: 15 - I: 24) - MISSED DEADLINE
+
+
+def task_arrays(aggregator, tasks, priorities, interarrival):
+    """
+    The task model as parallel lists C, B, T, P (in the order of tasks)
+    """
+    P = [int(p) for p in priorities]
+    T = [int(t) for t in interarrival]
+    C = [aggregator.wcet.get(t, 0) for t in tasks]
+    blocking = BlockingIndex(aggregator.claims, dict(zip(tasks, P)))
+    B = [blocking(p) for p in P]
+    return C, B, T, P
+
+
+def task_constraints(T, deadlines=None, jitter=None):
+    """
+    The deadlines D and release jitters J as lists of ints, D defaults to T
+    and J to 0
+    """
+    D = [int(d) for d in deadlines] if deadlines else list(T)
+    J = [int(j) for j in jitter] if jitter else [0] * len(T)
+    return D, J
+
+
+def deadline_analysis(aggregator, tasks, priorities, interarrival,
+                      deadlines, jitter):
+    """
+    Exact busy period response times for arbitrary deadlines and release
+    jitter, and the processor demand (QPA) test of the task set under EDF
+    """
+    C, B, T, P = task_arrays(aggregator, tasks, priorities, interarrival)
+    D, J = task_constraints(T, deadlines, jitter)
+    R, missed = rta.busy_period_response_times(C, B, T, P, D, J)
+
+    print("\nBusy period response times (deadline, jitter):")
+    for i in sorted(range(len(tasks)), key=lambda i: tasks[i]):
+        print("R_%s = %s (C: %s - B: %s - D: %s - J: %s)%s" % (
+            tasks[i], R[i], C[i], B[i], D[i], J[i],
+            " - MISSED DEADLINE" if missed[i] else ""))
+
+    H = [max([hold for (task, ceiling), hold in aggregator.claims.items()
+              if task == t] + [0]) for t in tasks]
+    schedulable, points = rta.qpa(C, T, D, J, H)
+    print("EDF processor demand (QPA): %s (%d points checked)" % (
+        "schedulable" if schedulable else "NOT schedulable", points))
+
+
+def vector_response_algorithm(aggregator, tasks, priorities, interarrival,
+                              deadlines=None, jitter=None):
+    """
+    Assignment 4 computed by rta.response_times, for large task sets
+    """
+    C, B, T, P = task_arrays(aggregator, tasks, priorities, interarrival)
+    D, J = task_constraints(T, deadlines, jitter)
+    R, I, missed = rta.response_times(C, B, T, P, stop_at_deadline=False,
+                                      D=D, J=J)
+
+    print("\nCalculated Response Times (Assignment 4):")
+    for i in sorted(range(len(tasks)), key=lambda i: tasks[i]):
+        print("R_%s = %s (C: %s - B: %s - I: %s)%s" % (
+            tasks[i], R[i], C[i], B[i], I[i],
+            " - MISSED DEADLINE" if missed[i] else ""))
+
+
+def task_segments(outputdata, tasks, priorities):
+    """
+    The measured execution of each task as (duration, level) segments, for
+    simulate.simulate
+
+    The test with the longest Finish time of a task is used. Each Enter
+    raises the level to the ceiling of the claim (never below the level it
+    is nested in), each Exit returns to the level before it.
+    """
+    priority = {t: int(p) for (t, p) in zip(tasks, priorities)}
+    worst = {}
+    running = {}
+    for obj in outputdata:
+        test, task, cycles, level, action = obj
+        action = Action[action] if isinstance(action, str) else action
+        if task not in priority:
+            continue
+        if action == Action.Start:
+            running[test] = ([], [priority[task]], cycles)
+            continue
+        if test not in running:
+            continue
+        segments, levels, last = running[test]
+        if cycles > last:
+            if segments and segments[-1][1] == levels[-1]:
+                segments[-1] = (segments[-1][0] + cycles - last, levels[-1])
+            else:
+                segments.append((cycles - last, levels[-1]))
+        running[test] = (segments, levels, cycles)
+        if action == Action.Enter:
+            levels.append(max(int(level), levels[-1]))
+        elif action == Action.Exit and len(levels) > 1:
+            levels.pop()
+        elif action == Action.Finish:
+            del running[test]
+            if cycles > worst.get(task, (-1, None))[0]:
+                worst[task] = (cycles, segments)
+    return [worst.get(t, (0, []))[1] for t in tasks]
+
+
+""" Default simulation length, when the hyperperiod is longer """
+SIMULATE_HORIZON_MAX = 10 ** 7
+
+
+def simulation_analysis(aggregator, outputdata, tasks, priorities,
+                        interarrival, horizon=None, runs=1, deadlines=None,
+                        jitter=None):
+    """
+    Replay the measured tasks in a discrete-event simulation of SRP and
+    compare the observed response times with Assignment 4
+
+    The first run releases all tasks at 0, further runs at random offsets
+    and release jitters, seeded by the run number. An observed response
+    time above the analysis means the analysis is not safe for the trace
+    (for tasks that meet their deadline, later jobs of a task that misses
+    may take longer than the first).
+    """
+    C, B, T, P = task_arrays(aggregator, tasks, priorities, interarrival)
+    D, J = task_constraints(T, deadlines, jitter)
+    R, _, missed = rta.response_times(C, B, T, P, stop_at_deadline=False,
+                                      D=D, J=J)
+    segments = task_segments(outputdata, tasks, priorities)
+    if horizon is None:
+        horizon = simulate.hyperperiod(T)
+        if horizon > SIMULATE_HORIZON_MAX:
+            print("\nThe hyperperiod is %d cycles, simulating the first %d "
+                  "(give CYCLES to change)" % (horizon, SIMULATE_HORIZON_MAX))
+            horizon = SIMULATE_HORIZON_MAX
+
+    observed = [None] * len(tasks)
+    jobs = 0
+    for run in range(runs):
+        R_run, jobs_run = simulate.simulate(segments, T, P, horizon, J,
+                                            seed=run if run else None)
+        jobs += jobs_run
+        for i, r in enumerate(R_run):
+            if r is not None and (observed[i] is None or r > observed[i]):
+                observed[i] = r
+
+    print("\nSimulated Response Times (%d jobs, %d run(s) of %d cycles):" % (
+        jobs, runs, horizon))
+    for i in sorted(range(len(tasks)), key=lambda i: tasks[i]):
+        note = ""
+        if missed[i]:
+            note = " - MISSED DEADLINE"
+        elif observed[i] is not None and observed[i] > R[i]:
+            note = " - EXCEEDS ANALYSIS"
+        print("R_%s = %s (analysis: %s)%s" % (tasks[i], observed[i], R[i],
+                                              note))
+    return observed
+
+
+class SrpBlocking:
+    """
+    Blocking under SRP when the priorities of the tasks are moved
+
+    The trace does not tell which resource a claim is on, only its ceiling
+    under the measured priorities. A claim at ceiling c is therefore taken
+    to be on a resource shared with every task measured at priority c (the
+    ceiling is the priority of its highest user), or with every task at or
+    above c if there is none. Under a new assignment the claim blocks task
+    i if the claiming task is below i and one of these users is i or above
+    it, i.e. the moved ceiling reaches i.
+
+    Calling it with (i, higher), the indices of the tasks above i, gives
+    the blocking of task i.
+    """
+
+    def __init__(self, aggregator, tasks, priorities):
+        P = [int(p) for p in priorities]
+        index = {t: i for i, t in enumerate(tasks)}
+        self.claims = []
+        for (task, ceiling), hold in aggregator.claims.items():
+            if task not in index:
+                continue
+            users = {i for i, p in enumerate(P) if p == ceiling}
+            if not users:
+                users = {i for i, p in enumerate(P) if p >= ceiling}
+            users.add(index[task])
+            self.claims.append((index[task], users, hold))
+
+    def __call__(self, i, higher):
+        b_time = 0
+        for (j, users, hold) in self.claims:
+            if (j != i and j not in higher and hold > b_time and
+                    (i in users or not users.isdisjoint(higher))):
+                b_time = hold
+        return b_time
+
+
+def audsley_assignment(aggregator, tasks, priorities, interarrival):
+    """
+    Search a feasible priority assignment for the measured tasks and
+    print it with its response times
+    """
+    C, B, T, P = task_arrays(aggregator, tasks, priorities, interarrival)
+    blocking = SrpBlocking(aggregator, tasks, priorities)
+    P_new, evaluations = rta.audsley(C, T, blocking)
+
+    print("\nPriority assignment (Audsley, %d RTA evaluations):" %
+          evaluations)
+    if P_new is None:
+        print("No feasible priority assignment")
+        return None
+
+    order = rta.priority_order(P_new)
+    B_new = [0] * len(tasks)
+    for k, i in enumerate(order):
+        B_new[i] = blocking(i, set(order[:k]))
+    R, I, missed = rta.response_times(C, B_new, T, P_new)
+    for i in sorted(range(len(tasks)), key=lambda i: tasks[i]):
+        print("%s priority %s (was %s): R = %s (C: %s - B: %s - I: %s)" % (
+            tasks[i], P_new[i], P[i], R[i], C[i], B_new[i], I[i]))
+    return P_new
+
+
+""" Result of one sweep candidate, response and missed are None when the
+    candidate was decided by a bound (see rta.prefilter) """
+SweepResult = collections.namedtuple('SweepResult', [
+    'interarrival', 'priorities', 'utilization', 'schedulable', 'response',
+    'missed', 'stage'])
+
+
+""" Counters of rta.IncrementalRTA summed over an incremental sweep """
+INCREMENTAL_COUNTERS = ('reused', 'warm', 'cold', 'iterations')
+
+
+def _sweep_chunk(job):
+    """
+    Evaluate one chunk of candidates sharing C, B and P, returns the
+    results and the IncrementalRTA counters (None for the batched engine)
+    """
+    C, B, P, Ts, prefilter, incremental = job
+    verdicts = []
+    for T in Ts:
+        if prefilter:
+            verdicts.append(rta.prefilter(C, B, T, P))
+        else:
+            verdicts.append((None, 'exact'))
+
+    exact = [T for (T, (schedulable, stage)) in zip(Ts, verdicts)
+             if schedulable is None]
+    counters = None
+    if incremental:
+        """ Neighbouring candidates reuse or warm start the fixpoints """
+        engine = rta.IncrementalRTA()
+        R = []
+        missed = []
+        for T in exact:
+            r, _, m = engine.response_times(C, B, T, P)
+            R.append(r)
+            missed.append(m)
+        counters = [getattr(engine, name) for name in INCREMENTAL_COUNTERS]
+    else:
+        R, missed = rta.response_times_batch(C, B, exact, P)
+    R = iter(R)
+    missed = iter(missed)
+
+    results = []
+    for T, (schedulable, stage) in zip(Ts, verdicts):
+        utilization = sum(c / t for (c, t) in zip(C, T))
+        if schedulable is None:
+            r, m = next(R), next(missed)
+            results.append(SweepResult(T, P, utilization, not any(m), r, m,
+                                       stage))
+        else:
+            results.append(SweepResult(T, P, utilization, schedulable, None,
+                                       None, stage))
+    return results, counters
+
+
+def sweep(aggregator, tasks, priorities, candidates, processes=None,
+          chunksize=256, prefilter=False, incremental=False, stats=None):
+    """
+    What-if analysis of many (interarrival, priorities) candidates
+
+    The WCETs and critical sections are taken from the aggregator once,
+    blocking is computed once per distinct priority vector (priorities is
+    used when a candidate gives None), with the ceilings moved along with
+    the priorities. Candidates are evaluated in batches
+    of chunksize, in parallel over processes (all cores by default).
+
+    With prefilter only the candidates not decided by the utilization,
+    Liu & Layland or hyperbolic bounds get the exact analysis. With
+    incremental the exact analysis runs candidate by candidate through
+    rta.IncrementalRTA instead of batched, which pays off when neighbouring
+    candidates differ in a few tasks. Its counters, summed over the chunks,
+    are then stored in the dict stats if one is given.
+
+    Returns a SweepResult per candidate, in the order given.
+    """
+    C = [aggregator.wcet.get(t, 0) for t in tasks]
+    groups = {}
+    for index, (T, P) in enumerate(candidates):
+        P = tuple(int(p) for p in (P if P is not None else priorities))
+        groups.setdefault(P, []).append((index, [int(t) for t in T]))
+
+    jobs = []
+    indices = []
+    blocking = SrpBlocking(aggregator, tasks, priorities)
+    for P, members in groups.items():
+        """ The ceilings move with the priorities, see SrpBlocking """
+        order = rta.priority_order(P)
+        B = [0] * len(tasks)
+        for k, i in enumerate(order):
+            B[i] = blocking(i, set(order[:k]))
+        for start in range(0, len(members), chunksize):
+            chunk = members[start:start + chunksize]
+            jobs.append((C, B, list(P), [T for (index, T) in chunk],
+                         prefilter, incremental))
+            indices.append([index for (index, T) in chunk])
+
+    if processes == 1 or len(jobs) < 2:
+        chunks = [_sweep_chunk(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            chunks = pool.map(_sweep_chunk, jobs)
+
+    results = [None] * sum(len(chunk) for chunk in indices)
+    for chunk_indices, (chunk, counters) in zip(indices, chunks):
+        for index, result in zip(chunk_indices, chunk):
+            results[index] = result
+        if stats is not None and counters is not None:
+            for name, count in zip(INCREMENTAL_COUNTERS, counters):
+                stats[name] = stats.get(name, 0) + count
+    return results
+
+
+def sweep_candidates(path):
+    """
+    Read sweep candidates, one per line as
+
+    interarrivals [; priorities]
+
+    e.g. "100 30 40" or "80 30 40; 1 3 2", empty lines and lines starting
+    with # are skipped
+    """
+    candidates = []
+    with open(path) as fin:
+        for line in fin:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            fields = line.split(';')
+            T = fields[0].replace(',', ' ').split()
+            P = fields[1].replace(',', ' ').split() if len(fields) > 1 else None
+            candidates.append((T, P))
+    return candidates
+
+
+def print_sweep(tasks, results):
+    print("\nSweep (%s):" % ", ".join(tasks))
+    for r in results:
+        print("T = %s P = %s U = %.4f R = %s%s" % (
+            r.interarrival, r.priorities, r.utilization,
+            r.response if r.response is not None else r.stage,
+            "" if r.schedulable else " - MISSED DEADLINE"))
+
+    counters = collections.Counter(r.stage for r in results)
+    print("Decided by: %s" % ", ".join(
+        "%s %d" % (stage, counters[stage])
+        for stage in rta.stages))
+
+
+def sensitivity_analysis(aggregator, tasks, priorities, interarrival):
+    """
+    WCET headroom of the task set, as the critical scaling factor of all
+    C (and B) and as the largest C of each task on its own
+    """
+    C, B, T, P = task_arrays(aggregator, tasks, priorities, interarrival)
+    alpha, evaluations = rta.critical_scaling_factor(C, B, T, P)
+    max_C, evaluations_C = rta.wcet_slack(C, B, T, P)
+
+    print("\nSensitivity:")
+    print("Critical scaling factor = %.4f (%d RTA evaluations)" % (
+        alpha, evaluations))
+    for i in sorted(range(len(tasks)), key=lambda i: tasks[i]):
+        if max_C[i] is None:
+            print("%s max C: - (not schedulable as measured)" % tasks[i])
+        else:
+            print("%s max C: %s (slack %s cycles, factor %.4f)" % (
+                tasks[i], max_C[i], max_C[i] - C[i],
+                max_C[i] / C[i] if C[i] else float('inf')))
+    print("(%d RTA evaluations)" % evaluations_C)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Response time analysis of a saved measurement trace")
+    parser.add_argument('trace', help="trace file written by gdb.py")
+    parser.add_argument('--tasks', default='klee/tasks.txt',
+                        help="task model (default: %(default)s)")
+    parser.add_argument('--interarrival', nargs='+',
+                        help="override the interarrivals of the task model")
+    parser.add_argument('--claims', action='store_true',
+                        help="print all events and claim times")
+    parser.add_argument('--engine', choices=['loop', 'vector'],
+                        default='loop',
+                        help="response time engine for assignment 4, "
+                        "'vector' scales to large task sets")
+    parser.add_argument('--deadlines', action='store_true',
+                        help="also print the busy period analysis for the "
+                        "deadlines and jitter of the task model, and the "
+                        "EDF processor demand test")
+    parser.add_argument('--simulate', nargs='?', type=int, const=0,
+                        metavar='CYCLES',
+                        help="also simulate the task set under SRP for "
+                        "CYCLES (default: one hyperperiod, at most %d) and "
+                        "compare the observed response times with the "
+                        "analysis" % SIMULATE_HORIZON_MAX)
+    parser.add_argument('--runs', type=int, default=1,
+                        help="simulation runs, all but the first with random "
+                        "release offsets (default: %(default)s)")
+    parser.add_argument('--sensitivity', action='store_true',
+                        help="also print the critical scaling factor and "
+                        "the WCET slack of each task")
+    parser.add_argument('--audsley', action='store_true',
+                        help="also search a feasible priority assignment")
+    parser.add_argument('--sweep', metavar='FILE',
+                        help="evaluate the interarrival (and priority) "
+                        "vectors in FILE instead, one per line")
+    parser.add_argument('--prefilter', action='store_true',
+                        help="let --sweep skip the exact analysis for "
+                        "candidates decided by utilization bounds")
+    parser.add_argument('--incremental', action='store_true',
+                        help="let --sweep reuse and warm start the response "
+                        "times of neighbouring candidates instead of the "
+                        "batched engine")
+    parser.add_argument('--jobs', type=int,
+                        help="processes used by --sweep (default: all cores)")
+    args = parser.parse_args(argv)
+
+    tasks, priorities, interarrival, deadlines, jitter = tasklist_model(
+        tasklist_get(args.tasks))
+    if args.interarrival:
+        if len(args.interarrival) != len(tasks):
+            parser.error("expected %d interarrivals" % len(tasks))
+        """ Implicit deadlines follow the interarrivals """
+        deadlines = [new if d == t else d for (d, t, new) in
+                     zip(deadlines, interarrival, args.interarrival)]
+        interarrival = args.interarrival
+
+    """ These analyses assume implicit deadlines and no release jitter """
+    implicit = ([int(d) for d in deadlines] == [int(t) for t in interarrival]
+                and not any(int(j) for j in jitter))
+    for (option, name) in ((args.sweep, '--sweep'),
+                           (args.sensitivity, '--sensitivity'),
+                           (args.audsley, '--audsley')):
+        if option and not implicit:
+            parser.error("%s requires deadlines equal to the interarrivals "
+                         "and no release jitter" % name)
+
+    reader = TraceReader(args.trace)
+    if args.claims and not args.sweep:
+        print_claims(reader.load())
+    aggregator = Aggregator()
+    for event in reader:
+        aggregator.append(*event)
+
+    if args.sweep:
+        stats = {}
+        print_sweep(tasks, sweep(aggregator, tasks, priorities,
+                                 sweep_candidates(args.sweep), args.jobs,
+                                 prefilter=args.prefilter,
+                                 incremental=args.incremental, stats=stats))
+        if stats:
+            print("Incremental RTA: %s" % ", ".join(
+                "%s %d" % (name, stats[name])
+                for name in INCREMENTAL_COUNTERS))
+        reader.close()
+        return 0
+
+    compute_cpu_demand(aggregator, tasks, priorities, interarrival)
+    response_time_algorithm(aggregator, tasks, priorities, interarrival,
+                            deadlines, jitter)
+    if args.engine == 'vector':
+        vector_response_algorithm(aggregator, tasks, priorities, interarrival,
+                                  deadlines, jitter)
+    else:
+        recursive_response_algorithm(aggregator, tasks, priorities,
+                                     interarrival, deadlines, jitter)
+    if args.deadlines:
+        deadline_analysis(aggregator, tasks, priorities, interarrival,
+                          deadlines, jitter)
+    if args.simulate is not None:
+        simulation_analysis(aggregator, reader.load(), tasks, priorities,
+                            interarrival, args.simulate or None, args.runs,
+                            deadlines, jitter)
+    if args.sensitivity:
+        sensitivity_analysis(aggregator, tasks, priorities, interarrival)
+    if args.audsley:
+        audsley_assignment(aggregator, tasks, priorities, interarrival)
+    reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
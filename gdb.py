@@ -2,11 +2,28 @@
 import gdb
 import os
 import sys
+import mmap
 import struct
+import multiprocessing
+import hashlib
+import json
+import queue
+import shutil
+import threading
+import time
 from subprocess import call
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 import glob
-import math
+import re
+
+""" The analysis does not depend on gdb, it lives next to this script """
+sys.path.insert(0, os.path.dirname(os.path.abspath(
+    globals().get('__file__', 'gdb.py'))))
+from analysis import (Action, EventStore, TraceWriter, TraceReader,
+                      Aggregator, tasklist_get, tasklist_model, print_claims,
+                      compute_cpu_demand, response_time_algorithm,
+                      recursive_response_algorithm)
 
 """ ktest file version """
 version_no = 3
@@ -28,6 +45,8 @@ object_index_current = 0
 tasks = []
 priorities = []
 interarrival = []
+deadlines = []
+jitter = []
 
 task_name = ""
 file_name = ""
@@ -35,8 +54,82 @@ file_name = ""
 priority = 0
 first = True
 
-# [[ Test, Task, Cyccnt, priority/ceiling]]
-outputdata = []
+""" Decoded ktest records, (task, ((name, value), ...)) per file """
+ktest_table = []
+preload = True
+""" Below this many files the pool startup costs more than it saves """
+preload_min = 64
+
+""" Write ktest data with inferior memory writes instead of 'set variable' """
+batch_write = True
+target_byteorder = 'little'
+""" Variable name -> (address, size), resolved once per session """
+variable_locations = {}
+
+""" DWT registers, accessed as target memory (dwt_memory) or by monitor """
+DWT_CTRL = 0xe0001000
+DWT_CYCCNT = 0xe0001004
+dwt_memory = True
+
+""" Thumb BKPT #imm8 is 0xbeXX, the decoded imm is cached per pc """
+BKPT_OPCODE = 0xbe00
+bkpt_imms = {}
+
+""" Session caches of gdb types, ceiling symbols (per pc) and task stubs """
+gdb_types = {}
+ceiling_symbols = {}
+stub_functions = {}
+
+""" Persistent index of decoded ktest files, kept next to the klee-out dirs """
+ktest_index_file = "ktest_index.json"
+ktest_index_version = 1
+ktest_index = None
+ktest_index_dirty = False
+
+""" Features and target triple of each build mode """
+xargo_modes = {"klee": ("klee_mode", "x86_64-unknown-linux-gnu"),
+               "stm": ("wcet_bkpt", "thumbv7em-none-eabihf")}
+""" Files the build depends on, {example} is replaced by the example name """
+build_inputs = ["Cargo.toml", "Cargo.lock", "Xargo.toml", "build.rs",
+                "memory.x", ".cargo/config", "src/**/*.rs", "macros/**/*.rs",
+                "examples/{example}.rs"]
+""" A build is skipped when its stamp holds the hash of its inputs """
+build_stamp_suffix = ".build-stamp"
+
+""" Only sections that differ on the target are written, sections loaded
+    to RAM directly, anything in flash by a full load """
+verify_image = True
+ram_regions = [(0x20000000, 0x40000000)]
+
+""" Events measured per (image, task, inputs) are kept in a cache next to
+    the ELF and replayed instead of measured again """
+measure_cache_enable = True
+measure_cache_suffix = ".measurements.json"
+measure_cache_version = 1
+measure_cache = None
+measure_cache_dirty = False
+measure_image = None
+""" Key and events of the test being measured, None when not recording """
+measure_key = None
+measure_events = None
+
+""" Measure ktest files while KLEE is still running, polling its output """
+pipeline = False
+pipeline_poll = 0.2
+ktest_watcher = None
+
+""" Run one KLEE per task in parallel, on the entry point of each task
+    (the example must export one per task, named by the template) """
+klee_parallel = False
+klee_entry_template = "klee_{task}"
+""" klee-out directory -> index of the task it explored """
+klee_task_dirs = {}
+
+""" Events are streamed to trace_file (None to disable), and also kept in
+    outputdata unless keep_events is False """
+trace_file = "wcet_trace.bin"
+trace_writer = None
+keep_events = True
 
 """ Max number of events guard """
 object_index_max = 100
@@ -111,6 +204,127 @@ class KTest:
             program_name = program_name[:-3]
         self.programName = program_name
 
+
+class KTestMap:
+    """
+    Zero-copy variant of KTest, the file is memory mapped and the header is
+    decoded in one pass into (offset, size) pairs. Names and data are only
+    sliced out of the mapping when they are accessed.
+
+    Provides the same attributes as KTest (version, args, symArgvs,
+    symArgvLen, objects, programName, filename).
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            print("ERROR: file %s not found" % (path))
+            sys.exit(1)
+
+        self.filename = path
+        with open(path, 'rb') as f:
+            try:
+                self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                """ Empty files can not be mapped """
+                raise KTestError('unrecognized file')
+        self.__view = memoryview(self.__map)
+        try:
+            self.__parse()
+        except KTestError:
+            self.close()
+            raise
+
+    def __parse(self):
+        view = self.__view
+        if len(view) < 13 or (view[:5] != b'KTEST' and view[:5] != b"BOUT\n"):
+            raise KTestError('unrecognized file')
+
+        try:
+            self.version, numArgs = struct.unpack_from('>ii', view, 5)
+            if self.version > version_no:
+                raise KTestError('unrecognized version')
+            pos = 13
+
+            self.__args = []
+            for i in range(numArgs):
+                size, = struct.unpack_from('>i', view, pos)
+                self.__args.append((pos + 4, size))
+                pos += 4 + size
+
+            if self.version >= 2:
+                self.symArgvs, self.symArgvLen = struct.unpack_from(
+                    '>ii', view, pos)
+                pos += 8
+            else:
+                self.symArgvs = 0
+                self.symArgvLen = 0
+
+            numObjects, = struct.unpack_from('>i', view, pos)
+            pos += 4
+            self.__objects = []
+            for i in range(numObjects):
+                name_size, = struct.unpack_from('>i', view, pos)
+                name_pos = pos + 4
+                pos = name_pos + name_size
+                data_size, = struct.unpack_from('>i', view, pos)
+                data_pos = pos + 4
+                pos = data_pos + data_size
+                self.__objects.append((name_pos, name_size,
+                                       data_pos, data_size))
+        except struct.error:
+            raise KTestError('truncated file')
+
+        if pos > len(view):
+            raise KTestError('truncated file')
+
+    def __len__(self):
+        return len(self.__objects)
+
+    def name(self, i):
+        """ Name of object i, names are short so they are copied """
+        name_pos, name_size, _, _ = self.__objects[i]
+        return self.__view[name_pos:name_pos + name_size].tobytes()
+
+    def data(self, i):
+        """ Data of object i as a memoryview into the mapping """
+        _, _, data_pos, data_size = self.__objects[i]
+        return self.__view[data_pos:data_pos + data_size]
+
+    @property
+    def objects(self):
+        return [(self.name(i), self.data(i))
+                for i in range(len(self.__objects))]
+
+    @property
+    def args(self):
+        return [self.__view[pos:pos + size].tobytes().decode(encoding='ascii')
+                for (pos, size) in self.__args]
+
+    @property
+    def programName(self):
+        program_name = os.path.basename(self.args[0])
+        # sometimes program names end in .bc, so strip them
+        if program_name.endswith('.bc'):
+            program_name = program_name[:-3]
+        return program_name
+
+    def close(self):
+        """ Release the mapping, views handed out must be dropped first """
+        self.__view.release()
+        self.__map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# [[ Test, Task, Cyccnt, priority/ceiling, Action]]
+outputdata = EventStore()
+""" WCET and critical sections, updated as the events are recorded """
+aggregator = Aggregator()
+
 # Event handling
 
 # Ugly hack to avoid race condtitons in the python gdb API
@@ -124,6 +338,31 @@ class Executor:
         gdb.execute(self.__cmd)
 
 
+def event_append(action, level):
+    """
+    Record an event of the current test at the current cycle count
+    """
+    cycles = gdb_cyccnt_read()
+    if measure_events is not None:
+        measure_events.append([cycles, level, action.name])
+    event_record(action, level, cycles)
+
+
+def event_record(action, level, cycles):
+    """
+    Record an event of the current test, measured or replayed
+    """
+    if debug:
+        print("Debug: Append action {} at cycle {}".format(
+            action.name, cycles))
+
+    aggregator.append(file_name, task_name, cycles, level, action)
+    if keep_events:
+        outputdata.append(file_name, task_name, cycles, level, action)
+    if trace_writer is not None:
+        trace_writer.append(file_name, task_name, cycles, level, action)
+
+
 """
 Every time a breakpoint is hit this function is executed
 """
@@ -147,23 +386,17 @@ def stop_event(evt):
 
     elif imm == 1 or imm == 2:
         try:
-            ceiling = int(gdb.parse_and_eval(
-                "ceiling").cast(gdb.lookup_type('u8')))
+            ceiling = gdb_ceiling_read()
         except gdb.error:
             print("No ceiling found, exciting!")
             sys.exit(1)
 
         if imm == 1:
-            action = "Enter"
+            action = Action.Enter
         elif imm == 2:
-            action = "Exit"
+            action = Action.Exit
 
-        if debug:
-            print("Debug: Append action {} at cycle {}".format(
-                action, gdb_cyccnt_read()))
-
-        outputdata.append(
-            [file_name, task_name, gdb_cyccnt_read(), ceiling, action])
+        event_append(action, ceiling)
 
         gdb.post_event(Executor("continue"))
 
@@ -207,24 +440,26 @@ def posted_event_init():
             print("Debug: Skipped first measurement")
 
     else:
-        if debug:
-            print("Debug: Append Finish action at cycle {}"
-                  .format(gdb_cyccnt_read()))
-
-        outputdata.append(
-            [file_name, task_name, gdb_cyccnt_read(), priority, "Finish"])
+        event_append(Action.Finish, priority)
+        measure_store()
 
     """ loop to skip to next task *omitting the dummy* """
     while True:
         file_index_current += 1
-        if file_index_current == len(file_list):
+        if file_index_current == len(file_list) and not ktest_next():
             """ finished """
             break
 
-        task_to_test = ktest_setdata(file_index_current)
-        if 0 <= task_to_test < len(tasks):
-            """ next """
-            break
+        task_to_test, variables = ktest_record(file_index_current)
+        if not 0 <= task_to_test < len(tasks):
+            continue
+        if measure_replay(file_index_current, task_to_test, variables):
+            """ measured before, on the same image with the same inputs """
+            continue
+
+        ktest_setdata(file_index_current)
+        """ next """
+        break
 
     if file_index_current < len(file_list):
         """ Load the variable data """
@@ -237,228 +472,419 @@ def posted_event_init():
         """
         gdb_cyccnt_reset()
 
-        file_name = file_list[file_index_current].split('/')[-1]
+        file_name = ktest_name(file_list[file_index_current])
         task_name = tasks[task_to_test]
         priority = priorities[task_to_test]
 
-        outputdata.append([file_name, task_name,
-                           gdb_cyccnt_read(), priority, "Start"])
+        measure_start(task_to_test, variables)
+        event_append(Action.Start, priority)
 
         print('Task to call: %s \n' % (
             tasks[task_to_test] + "()"))
-        gdb.execute('call %s' % "stub_" +
-                    tasks[task_to_test] + "()")
+        gdb_task_call(tasks[task_to_test])
 
     else:
         """ here we are done, call your analysis here """
-        offset = 1
+        if trace_writer is not None:
+            trace_writer.close()
+            print("\nTrace written to %s" % trace_writer.path)
+            if not keep_events:
+                outputdata = TraceReader(trace_writer.path).load()
+
+        measure_cache_save()
+
         print("\nFinished all ktest files!\n")
-        print("Claims:")
-        for index, obj in enumerate(outputdata):
-            if obj[4] == "Exit":
-                claim_time = (obj[2] -
-                              outputdata[index - (offset)][2])
-                print("%s Claim time: %s" % (obj, claim_time))
-                offset += 2
-            elif obj[4] == "Finish" and not obj[2] == 0:
-                offset = 1
-                tot_time = obj[2]
-                print("%s Total time: %s" % (obj, tot_time))
-            else:
-                print("%s" % (obj))
-        compute_cpu_demand(outputdata)
-        response_time_algorithm(outputdata)
-        recursive_response_algorithm(outputdata)
+        print_claims(outputdata)
+        compute_cpu_demand(aggregator, tasks, priorities, interarrival)
+        response_time_algorithm(aggregator, tasks, priorities, interarrival,
+                                deadlines, jitter)
+        recursive_response_algorithm(aggregator, tasks, priorities,
+                                     interarrival, deadlines, jitter)
         # comment out to prevent gdb from quit on finish, useful to debugging
         gdb.execute("quit")
 
-def compute_cpu_demand(outputdata):
-    utilization = 0
-    task_array = []
-
-    #Create list of dictionaries with key:value pairs for task name, task demand, task interarrival
-    for index, t in enumerate(tasks):
-        data = {'name': t, 'demand': 0, 'interarrival': interarrival[index]}
-        task_array.append(data)
-    newlist = sorted(task_array, key=lambda k: k['name']) 
-    
-    #Update task total time
-    for index, obj in enumerate(outputdata):
-        if obj[4] == "Finish" and not obj[2] == 0:
-            for i, entry in enumerate(newlist):
-                if entry['name'] == obj[1]:
-                    entry['demand'] = obj[2]
-    print("\nComputed CPU Demand (Assignment 2):")
-
-    #Print computed CPU demand and calculcate total utilization
-    for i, entry in enumerate(newlist):
-        print("%s = %s/%s" % (entry['name'], entry['demand'], entry['interarrival']))
-        utilization += int(entry['demand'])/int(entry['interarrival'])
-    print("------------")
-    print("sum = %s" % (utilization))
-
-    # EXTI1 = 37/100
-    # EXTI2 = 12/30
-    # EXTI3 = 8/40
-    # ------------
-    # sum   = 0.97
-
-def response_time_algorithm(outputdata):
-    task_array = []
-
-    #Create list of dictionaries with key:value pairs for task name, c_time, b_time, i_time, priority and interarrival
-    for index, t in enumerate(tasks):
-        data = {'name': t, 'c_time': 0, 'b_time': 0, 'i_time': 0, 'priority': priorities[index], 'interarrival': interarrival[index]}
-        task_array.append(data)
-    newlist = sorted(task_array, key=lambda k: k['name']) 
-
-    #Name, Priority, Interarrival is already known and inserted, but we need c_time, b_time and i_time!
-    
-    #Find WCET (c_time) for each task
-    for index, obj in enumerate(outputdata):
-        if obj[4] == "Finish" and not obj[2] == 0:
-            for i, entry in enumerate(newlist):
-                if entry['name'] == obj[1]:
-                    entry['c_time'] = obj[2]
-
-    #Calculate Blocked time (b_time) for each task
-    offset = 1
-    for index, obj in enumerate(outputdata):
-        if obj[4] == "Exit":
-            p_temp = int(obj[3])
-            claim_time = (obj[2] -
-                              outputdata[index - (offset)][2])
-            for i, entry in enumerate(newlist):
-                if p_temp >= int(entry['priority']) and not obj[1] == entry['name']:
-                    entry['b_time'] = claim_time
-            offset += 2
-        elif obj[4] == "Finish" and not obj[2] == 0:
-            offset = 1
-            tot_time = obj[2]
-
-    #Calculate Interference time (i_time) for each task
-    for i, entry in enumerate(newlist):
-        p_temp = int(entry['priority'])
-        i_temp = int(entry['interarrival'])
-        for j, entry2 in enumerate(newlist):
-            if p_temp < int(entry2['priority']):
-                i2_temp = int(entry2['interarrival'])
-                multiplier = math.ceil(i_temp/i2_temp)
-                entry['i_time'] += (multiplier * int(entry2['c_time']))
-
-    #Calculate and Print response times
-    print("\nCalculated Response Times (Assignment 3):")
-    for i, entry in enumerate(newlist):
-        print("R_%s = %s (C: %s - B: %s - I: %s)" % (entry['name'], (entry['c_time'] + entry['b_time'] + entry['i_time']), entry['c_time'], entry['b_time'], entry['i_time']))
-
-    #R_EXTI1 = 109 (C: 37 - B: 0 - I: 72)
-    #R_EXTI2 = 22 (C: 12 - B: 10 - I: 0)
-    #R_EXTI3 = 47 (C: 8 - B: 15 - I: 24)
-
-def recursive_response_algorithm(outputdata):
-    task_array = []
-
-    #Create list of dictionaries with key:value pairs for task name, r_time, c_time, b_time, i_time, priority and interarrival
-    for index, t in enumerate(tasks):
-        data = {'name': t, 'r_time': 0, 'c_time': 0, 'b_time': 0, 'i_time': 0, 'priority': priorities[index], 'interarrival': interarrival[index], 'missed': False}
-        task_array.append(data)
-    newlist = sorted(task_array, key=lambda k: k['priority'], reverse=True) 
-
-    #Name, Priority, Interarrival is already known and inserted, but we need r_time, c_time, b_time and i_time!
-    
-    #Find WCET (c_time) for each task
-    for index, obj in enumerate(outputdata):
-        if obj[4] == "Finish" and not obj[2] == 0:
-            for i, entry in enumerate(newlist):
-                if entry['name'] == obj[1]:
-                    entry['c_time'] = obj[2]
-
-    #Calculate Blocked time (b_time) for each task
-    offset = 1
-    for index, obj in enumerate(outputdata):
-        if obj[4] == "Exit":
-            p_temp = int(obj[3])
-            claim_time = (obj[2] -
-                              outputdata[index - (offset)][2])
-            for i, entry in enumerate(newlist):
-                if p_temp >= int(entry['priority']) and not obj[1] == entry['name']:
-                    entry['b_time'] = claim_time
-            offset += 2
-        elif obj[4] == "Finish" and not obj[2] == 0:
-            offset = 1
-            tot_time = obj[2]
-
-    #Calculate Interference time (i_time) for each task
-    for i, entry in enumerate(newlist):
-        i_temp = 0
-        i_temp2 = -1
-        r_temp = int(entry['c_time']) + int(entry['b_time'])
-        looparray = [] #This array holds all the tasks with higher priority than task i
-
-        #Highest priority task
-        if i == 0:
-            entry['r_time'] = int(entry['c_time'] + int(entry['b_time']))
-
-        #Everything below highest priority task
-        else:
 
-            #Add all tasks with higher priorty than task i to the loop array
-            for j, entry2 in enumerate(newlist):
-                if j < i:
-                    #print("%s has higher priority than %s" % (entry2['name'], entry['name']))
-                    looparray.append(entry2)
-
-            #Very ugly hack, but it works
-            while i_temp != i_temp2:
-                i_total = 0
-                i_temp2 = i_temp
-                #Loop through every item in the loop array and perform the calculations
-                for i, item in enumerate(looparray):
-                    i_temp = (math.ceil(r_temp/int(item['interarrival']))* item['c_time'])
-                    i_total += i_temp
-                r_temp = int(entry['c_time']) + int(entry['b_time'])+ i_total
-            entry['r_time'] = r_temp
-            entry['i_time'] = i_total
-            i_temp = 0
-            if int(entry['r_time']) > int(entry['interarrival']):
-                entry['missed'] = True
-
-    #Calculate and Print response times
-    print("\nCalculated Response Times (Assignment 4):")
-    #Resort the list back to sorted by name, instead of priority for printing purposes
-    printlist = sorted(newlist, key=lambda k: k['name']) 
-    for i, entry in enumerate(printlist):
-        #If Deadline is missed
-        if entry['missed'] == True:
-            print("R_%s = %s (C: %s - B: %s - I: %s) - MISSED DEADLINE" % (entry['name'], entry['r_time'], entry['c_time'], entry['b_time'], entry['i_time']))
-        #If Deadline is not missed
-        else:
-            print("R_%s = %s (C: %s - B: %s - I: %s)" % (entry['name'], entry['r_time'], entry['c_time'], entry['b_time'], entry['i_time']))
+""" struct format for decoding ktest objects, keyed by object size """
+ktest_formats = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+
 
-    #interarrivals[100,30,40]
-    #Calculated Response Times:
-    #R_EXTI1 = 109 (C: 37 - B: 0 - I: 40) - MISSED DEADLINE
-    #R_EXTI2 = 22 (C: 12 - B: 10 - I: 0)
-    #R_EXTI3 = 47 (C: 8 - B: 15 - I: 12) - MISSED DEADLINE 
+def ktest_value(data):
+    """
+    Decode the data of a ktest object into an integer
+    """
+    return struct.unpack(ktest_formats.get(len(data), 'i'), data)[0]
+
+
+def ktest_decode(path):
+    """
+    Parse a ktest-file into a compact record
 
-    #interarrivals[100,40,50]
-    #Calculated Response Times:
-    #R_EXTI1 = 77 (C: 37 - B: 0 - I: 40)
-    #R_EXTI2 = 22 (C: 12 - B: 10 - I: 0)
-    #R_EXTI3 = 35 (C: 8 - B: 15 - I: 12)
+    (task_to_test, ((name, value), ...))
 
-    #interarrivals[80,30,40]
-    #Calculated Response Times:
-    #R_EXTI1 = 109 (C: 37 - B: 0 - I: 72) - MISSED DEADLINE
-    #R_EXTI2 = 22 (C: 12 - B: 10 - I: 0)
-    #R_EXTI3 = 47 (C: 8 - B: 15 - I: 24) - MISSED DEADLINE
+    Only plain python types are returned, so records can be handed back
+    from a process pool. task_to_test is -1 if no "task" object is found.
+    """
+    task_to_test = -1
+    variables = []
+    with KTestMap(path) as b:
+        for i in range(len(b)):
+            name = b.name(i).decode('UTF-8')
+            with b.data(i) as data:
+                value = ktest_value(data)
+            if name == "task":
+                task_to_test = value
+            else:
+                variables.append((name, value))
+
+    return (task_to_test, tuple(variables))
 
-def trimZeros(str):
-    for i in range(len(str))[::-1]:
-        if str[i] != '\x00':
-            return str[:i + 1]
 
-    return ''
+def ktest_preload(file_list, decode=ktest_decode):
+    """
+    Decode all ktest-files up front with a process pool, so the gdb event
+    loop only has to look up the records in ktest_table
+    """
+    if len(file_list) < preload_min:
+        return [decode(f) for f in file_list]
+
+    workers = min(os.cpu_count() or 1, len(file_list))
+    chunksize = max(1, len(file_list) // (workers * 4))
+    try:
+        """ gdb is not a python interpreter, so workers can not be spawned """
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(workers) as pool:
+            return pool.map(decode, file_list, chunksize)
+    except (OSError, ValueError) as e:
+        print("Preloading in parallel failed ({}), parsing serially"
+              .format(e))
+        return [decode(f) for f in file_list]
+
+
+def ktest_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def ktest_index_entry(path):
+    """
+    Decode a ktest-file into an index entry
+
+    [mtime_ns, size, sha1, task_to_test, [[name, value], ...]]
+    """
+    st = os.stat(path)
+    task_to_test, variables = ktest_decode(path)
+    return [st.st_mtime_ns, st.st_size, ktest_hash(path),
+            task_to_test, [list(v) for v in variables]]
+
+
+def ktest_index_folder():
+    return os.path.join(original_pwd, klee_out_folder)
+
+
+def ktest_index_get():
+    """
+    Load the persistent ktest index stored next to the klee-out directories
+
+    {"version": n,
+     "directories": {dir: {"mtime": mtime_ns, "files": [filename, ...]}},
+     "files": {relative path: index entry}}
+    """
+    global ktest_index
+
+    if ktest_index is None:
+        try:
+            with open(os.path.join(ktest_index_folder(),
+                                   ktest_index_file)) as fin:
+                ktest_index = json.load(fin)
+            if ktest_index.get("version") != ktest_index_version:
+                ktest_index = None
+        except (IOError, ValueError):
+            ktest_index = None
+
+    if ktest_index is None:
+        ktest_index = {"version": ktest_index_version,
+                       "directories": {}, "files": {}}
+    return ktest_index
+
+
+def ktest_index_save():
+    """ Write the index (if changed), through a rename to stay consistent """
+    global ktest_index_dirty
+
+    if not ktest_index_dirty:
+        return
+    path = os.path.join(ktest_index_folder(), ktest_index_file)
+    try:
+        with open(path + ".tmp", 'w') as fout:
+            json.dump(ktest_index, fout, separators=(',', ':'))
+        os.replace(path + ".tmp", path)
+        ktest_index_dirty = False
+    except IOError as e:
+        print("Could not write ktest index {}: {}".format(path, e))
+
+
+def ktest_listdir(folder, directory):
+    """
+    List the ktest-files of a klee-out directory
+
+    The listing is taken from the index as long as the directory has not been
+    modified. That only covers which files exist, a file rewritten in place
+    does not change the directory, so every file is still checked by
+    ktest_index_lookup.
+    """
+    global ktest_index_dirty
+
+    index = ktest_index_get()
+    mtime = os.stat(folder + directory).st_mtime_ns
+    entry = index["directories"].get(directory)
+    if entry is not None and entry["mtime"] == mtime:
+        names = entry["files"]
+    else:
+        names = sorted(f for f in os.listdir(folder + directory)
+                       if f.endswith(".ktest"))
+        index["directories"][directory] = {"mtime": mtime, "files": names}
+        ktest_index_dirty = True
+
+    return [os.path.join(folder + directory, n) for n in names]
+
+
+def ktest_index_lookup(path):
+    """
+    Return the indexed record of a file if it is still valid, else None
+
+    Files are matched by path, then by mtime and size, and if those differ
+    by content hash. Every file is stat'ed, only the hash is skipped when
+    mtime and size match.
+    """
+    global ktest_index_dirty
+
+    key = os.path.relpath(path, ktest_index_folder())
+    entry = ktest_index_get()["files"].get(key)
+    if entry is None:
+        return None
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if [st.st_mtime_ns, st.st_size] != entry[:2]:
+        if ktest_hash(path) != entry[2]:
+            return None
+        entry[0], entry[1] = st.st_mtime_ns, st.st_size
+        ktest_index_dirty = True
+
+    return (entry[3], tuple(tuple(v) for v in entry[4]))
+
+
+def ktest_cached_preload(file_list):
+    """
+    Build the ktest table from the index, only files that are new or have
+    changed are decoded (in parallel) and added to the index
+    """
+    global ktest_index_dirty
+
+    table = [ktest_index_lookup(f) for f in file_list]
+    misses = [f for (f, r) in zip(file_list, table) if r is None]
+    if debug:
+        print("Debug: ktest index {} hits, {} misses".format(
+            len(file_list) - len(misses), len(misses)))
+
+    if misses:
+        files = ktest_index_get()["files"]
+        entries = iter(ktest_preload(misses, ktest_index_entry))
+        for i, r in enumerate(table):
+            if r is None:
+                entry = next(entries)
+                files[os.path.relpath(file_list[i],
+                                      ktest_index_folder())] = entry
+                table[i] = (entry[3], tuple(tuple(v) for v in entry[4]))
+        ktest_index_dirty = True
+
+    ktest_index_save()
+    return table
+
+
+def measure_cache_path():
+    return os.path.join(original_pwd, stm_out_folder,
+                        example_name + measure_cache_suffix)
+
+
+def measure_cache_get():
+    """
+    Load the measurement cache
+
+    {"version": n,
+     "images": {image hash: {key: [[cycles, level, action], ...]}}}
+    """
+    global measure_cache
+
+    if measure_cache is None:
+        try:
+            with open(measure_cache_path()) as fin:
+                measure_cache = json.load(fin)
+            if measure_cache.get("version") != measure_cache_version:
+                measure_cache = None
+        except (IOError, ValueError):
+            measure_cache = None
+
+    if measure_cache is None:
+        measure_cache = {"version": measure_cache_version, "images": {}}
+    return measure_cache
+
+
+def measure_cache_save():
+    """ Write the cache (if changed), through a rename as the ktest index """
+    global measure_cache_dirty
+
+    if not measure_cache_dirty:
+        return
+    path = measure_cache_path()
+    try:
+        with open(path + ".tmp", 'w') as fout:
+            json.dump(measure_cache, fout, separators=(',', ':'))
+        os.replace(path + ".tmp", path)
+        measure_cache_dirty = False
+    except IOError as e:
+        print("Could not write measurement cache {}: {}".format(path, e))
+
+
+def measure_cache_key(task_to_test, variables):
+    return json.dumps([tasks[task_to_test], [list(v) for v in variables]],
+                      separators=(',', ':'))
+
+
+def measure_results():
+    """ The cached results of the loaded image """
+    return measure_cache_get()["images"].setdefault(measure_image, {})
+
+
+def measure_replay(file_index, task_to_test, variables):
+    """
+    Record the cached events of a test instead of running it, False if it
+    has not been measured on this image
+    """
+    global file_name
+    global task_name
+    global priority
+
+    if not measure_cache_enable or measure_image is None:
+        return False
+    events = measure_results().get(measure_cache_key(task_to_test,
+                                                     variables))
+    if events is None:
+        return False
+
+    file_name = ktest_name(file_list[file_index])
+    task_name = tasks[task_to_test]
+    priority = priorities[task_to_test]
+    if debug:
+        print("Debug: replaying {} events of {}".format(len(events),
+                                                       file_name))
+    for (cycles, level, action) in events:
+        event_record(Action[action], level, cycles)
+    return True
+
+
+def measure_start(task_to_test, variables):
+    """ Collect the events of the test about to run """
+    global measure_key
+    global measure_events
+
+    if not measure_cache_enable or measure_image is None:
+        return
+    measure_key = measure_cache_key(task_to_test, variables)
+    measure_events = []
+
+
+def measure_store():
+    """ Cache the events of the test that just finished """
+    global measure_key
+    global measure_events
+    global measure_cache_dirty
+
+    if measure_events is None:
+        return
+    measure_results()[measure_key] = measure_events
+    measure_cache_dirty = True
+    measure_key = None
+    measure_events = None
+
+
+def ktest_record(file_index):
+    """
+    Look up the record for a file, decoding it if it was not preloaded
+    """
+    if file_index < len(ktest_table):
+        return ktest_table[file_index]
+
+    return ktest_task_assign(file_list[file_index],
+                             ktest_decode(file_list[file_index]))
+
+
+def variable_location(name):
+    """
+    Resolve (address, size) of a variable once, None if it has no address
+    """
+    if name not in variable_locations:
+        try:
+            value = gdb.parse_and_eval(name)
+            if value.address is None:
+                variable_locations[name] = None
+            else:
+                variable_locations[name] = (int(value.address),
+                                            value.type.sizeof)
+        except gdb.error:
+            variable_locations[name] = None
+        if debug:
+            print("Debug: location of {} is {}".format(
+                name, variable_locations[name]))
+
+    return variable_locations[name]
+
+
+def ktest_write_batch(variables):
+    """
+    Write all variables straight into target memory
+
+    Adjacent variables are coalesced into a single write, variables that can
+    not be resolved (or written) fall back to 'set variable'.
+    """
+    writes = []
+    fallback = []
+    for (name, obj_data) in variables:
+        location = variable_location(name)
+        if location is None:
+            fallback.append((name, obj_data))
+            continue
+        address, size = location
+        """ Truncate to the size of the variable, as an assignment would """
+        data = (obj_data & ((1 << (8 * size)) - 1)).to_bytes(
+            size, target_byteorder)
+        writes.append((address, data, name, obj_data))
+    writes.sort()
+
+    """ Coalesce into blocks of [address, bytearray, [(name, value), ...]] """
+    blocks = []
+    for (address, data, name, obj_data) in writes:
+        if blocks and blocks[-1][0] + len(blocks[-1][1]) == address:
+            blocks[-1][1].extend(data)
+            blocks[-1][2].append((name, obj_data))
+        else:
+            blocks.append([address, bytearray(data), [(name, obj_data)]])
+
+    inferior = gdb.selected_inferior()
+    for (address, data, names) in blocks:
+        try:
+            inferior.write_memory(address, bytes(data))
+        except gdb.error:
+            fallback.extend(names)
+
+    if debug:
+        print("Debug: wrote {} variables in {} blocks, {} by set variable"
+              .format(len(writes), len(blocks), len(fallback)))
+
+    for (name, obj_data) in fallback:
+        gdb.execute('set variable %s = %r' % (name, obj_data))
 
 
 def ktest_setdata(file_index):
@@ -470,54 +896,39 @@ def ktest_setdata(file_index):
 
     if debug:
         print("Debug: ktest_setdata on index{}".format(file_index))
+        print('Debug: ktest file: %r \n' % file_list[file_index])
 
-    b = KTest.fromfile(file_list[file_index])
+    task_to_test, variables = ktest_record(file_index)
+    if debug:
+        print("Debug: Task to test:", task_to_test)
 
     if debug:
-        # print('ktest filename : %r' % filename)
-        print('Debug: ktest file: %r \n' % file_list[file_index])
-        # print('args       : %r' % b.args)
-        # print('num objects: %r' % len(b.objects))
-    for i, (name, data) in enumerate(b.objects):
-        str = trimZeros(data)
-
-        """ If Name is "task", skip it """
-        if name.decode('UTF-8') == "task":
-            if debug:
-                print('Debug: object %4d: name: %r' % (i, name))
-                print('Debug: object %4d: size: %r' % (i, len(data)))
-            # print(struct.unpack('i', str).repr())
-            # task_to_test = struct.unpack('i', str)[0]
-            # print("str: ", str)
-            # print("str: ", str[0])
-            task_to_test = struct.unpack('i', str)[0]
-            # task_to_test = int(str[0])
-            if debug:
-                print("Debug: Task to test:", task_to_test)
-        else:
-            if debug:
-                print('Debug: object %4d: name: %r' % (i, name))
-                print('Degug: object %4d: size: %r' % (i, len(data)))
-                print(str)
-            # if opts.writeInts and len(data) == 4:
-            obj_data = struct.unpack('i', str)[0]
-            if debug:
-                print('Dubug: object %4d: data: %r' %
-                      (i, obj_data))
-            # gdb.execute('whatis %r' % name.decode('UTF-8'))
-            # gdb.execute('whatis %r' % obj_data)
-            gdb.execute('set variable %s = %r' %
-                        (name.decode('UTF-8'), obj_data))
-            # gdb.write('Variable %s is:' % name.decode('UTF-8'))
-            # gdb.execute('print %s' % name.decode('UTF-8'))
-            # else:
-            # print('object %4d: data: %r' % (i, str))
+        for i, (name, obj_data) in enumerate(variables):
+            print('Debug: object %4d: name: %r data: %r' %
+                  (i, name, obj_data))
+
+    if batch_write:
+        ktest_write_batch(variables)
+    else:
+        for (name, obj_data) in variables:
+            gdb.execute('set variable %s = %r' % (name, obj_data))
 
     if debug:
         print("Dubug: Done with setdata")
     return task_to_test
 
 
+def klee_out_dirs(folder):
+    """
+    The klee-out-N directories of a single KLEE run, oldest first (the per
+    task directories of klee_run_tasks are left out)
+    """
+    dirlist = [d for d in next(os.walk(folder))[1]
+               if re.match(r"klee-out-\d+$", d)]
+    dirlist.sort(key=lambda d: int(d[len("klee-out-"):]))
+    return dirlist
+
+
 def ktest_iterate():
     """ Get the list of folders in current directory, sort and then grab the
         last one.
@@ -553,8 +964,7 @@ def ktest_iterate():
         xargo_run("klee")
         klee_run()
 
-    dirlist = next(os.walk("."))[1]
-    dirlist.sort()
+    dirlist = klee_out_dirs(".")
     if debug:
         print(dirlist)
 
@@ -564,8 +974,7 @@ def ktest_iterate():
         klee_run()
 
     """ Ran KLEE, need to update the dirlist """
-    dirlist = next(os.walk("."))[1]
-    dirlist.sort()
+    dirlist = klee_out_dirs(".")
     try:
         directory = dirlist[-1]
     except IOError:
@@ -576,12 +985,7 @@ def ktest_iterate():
     print("Using ktest-files from directory:\n" + rustoutputfolder + directory)
 
     """ Iterate over all files ending with ktest in the "klee-last" folder """
-    for filename in os.listdir(directory):
-        if filename.endswith(".ktest"):
-            file_list.append(os.path.join(rustoutputfolder + directory,
-                                          filename))
-        else:
-            continue
+    file_list.extend(ktest_listdir(rustoutputfolder, directory))
 
     file_list.sort()
     """ Return to the old path """
@@ -589,44 +993,191 @@ def ktest_iterate():
     return file_list
 
 
-def tasklist_get():
-    """ Parse the automatically generated tasklist
+class KTestWatcher(threading.Thread):
+    """
+    Polls the klee-out directory of a running KLEE and queues every new
+    ktest-file as (path, record) once it is complete, i.e. parses. A final
+    scan is made after KLEE has exited, then None marks the end (also if
+    the watcher fails).
+
+    Files that can not be decoded once complete, or are still truncated
+    after KLEE has exited, are listed in failed and not retried.
+    """
+
+    def __init__(self, folder, existing, process):
+        threading.Thread.__init__(self, daemon=True)
+        self.folder = folder
+        self.existing = existing
+        self.process = process
+        self.queue = queue.Queue()
+        self.failed = []
+        self.__seen = set()
+
+    def __fail(self, path, e):
+        print("Skipping ktest file {}: {}".format(path, e))
+        self.__seen.add(path)
+        self.failed.append(path)
+
+    def __scan(self, final=False):
+        dirlist = [d for d in klee_out_dirs(self.folder)
+                   if d not in self.existing]
+        if not dirlist:
+            return
+        directory = os.path.join(self.folder, dirlist[-1])
+        for f in sorted(os.listdir(directory)):
+            path = os.path.join(directory, f)
+            if not f.endswith(".ktest") or path in self.__seen:
+                continue
+            try:
+                record = ktest_decode(path)
+            except (KTestError, OSError) as e:
+                """ Still being written, retried on the next poll """
+                if final:
+                    self.__fail(path, e)
+                continue
+            except Exception as e:
+                """ Complete but not a valid test, e.g. odd object sizes """
+                self.__fail(path, e)
+                continue
+            self.__seen.add(path)
+            self.queue.put((path, record))
+
+    def run(self):
+        try:
+            while self.process.poll() is None:
+                self.__scan()
+                time.sleep(pipeline_poll)
+            self.__scan(final=True)
+            if self.process.returncode != 0:
+                print("KLEE exited with {}".format(self.process.returncode))
+        finally:
+            self.queue.put(None)
+
+
+def ktest_pipeline_start():
     """
+    Start KLEE in the background and watch its output, file_list and
+    ktest_table are then filled by ktest_next as the files arrive
+    """
+    global ktest_watcher
+
+    folder = original_pwd + "/" + klee_out_folder
+    existing = set(next(os.walk(folder))[1])
+    ktest_watcher = KTestWatcher(folder, existing, klee_start())
+    ktest_watcher.start()
 
+
+def ktest_next():
+    """
+    Wait for the next ktest-file of the pipeline, False when there is none
+    """
+    if ktest_watcher is None:
+        return False
+
+    item = ktest_watcher.queue.get()
+    if item is None:
+        """ Keep answering False if asked again """
+        ktest_watcher.queue.put(None)
+        return False
+
+    path, record = item
     if debug:
-        print(os.getcwd())
-    with open('klee/tasks.txt') as fin:
-        for line in fin:
-                # print(line)
-            if not line == "// autogenerated file\n":
-                return [x.strip().strip("[]\"").split(' ')
-                        for x in line.split(',')]
+        print("Debug: pipelined ktest file {}".format(path))
+    file_list.append(path)
+    ktest_table.append(record)
+    return True
 
 
 """ Run xargo for building """
 
 
-def xargo_run(mode):
-
-    if "klee" in mode:
-        xargo_cmd = ("xargo build --release --example " + example_name
-                     + " --features "
-                     + "klee_mode --target x86_64-unknown-linux-gnu ")
-    elif "stm" in mode:
-        xargo_cmd = ("xargo build --release --example " + example_name +
-                     " --features " +
-                     "wcet_bkpt --target thumbv7em-none-eabihf")
-    else:
+def xargo_command(mode):
+    if mode not in xargo_modes:
         print("Provide either 'klee' or 'stm' as mode")
         sys.exit(1)
 
-    call(xargo_cmd, shell=True)
+    features, target = xargo_modes[mode]
+    return ("xargo build --release --example " + example_name +
+            " --features " + features + " --target " + target)
+
+
+def xargo_run(mode):
+    call(xargo_command(mode), shell=True)
+
+
+def build_folder(mode):
+    return klee_out_folder if mode == "klee" else stm_out_folder
+
+
+def build_hash(mode):
+    """
+    Hash of everything a build depends on, the input files (by path and
+    content), the example, features and target triple
+    """
+    h = hashlib.sha1(xargo_command(mode).encode('UTF-8'))
+    paths = set()
+    for pattern in build_inputs:
+        paths.update(glob.glob(os.path.join(
+            original_pwd, pattern.format(example=example_name)),
+            recursive=True))
+    for path in sorted(paths):
+        h.update(os.path.relpath(path, original_pwd).encode('UTF-8') + b'\0')
+        with open(path, 'rb') as f:
+            h.update(hashlib.sha1(f.read()).digest())
+    return h.hexdigest()
+
+
+def build_stamp(mode):
+    return os.path.join(original_pwd, build_folder(mode),
+                        example_name + "." + mode + build_stamp_suffix)
+
+
+def build_artifacts(mode):
+    """ The build outputs used by this script, the ELF or the LLVM IR """
+    folder = os.path.join(original_pwd, build_folder(mode))
+    if mode == "klee":
+        return glob.glob(folder + example_name + "-*.bc")
+    return [f for f in [folder + example_name] if os.path.exists(f)]
+
+
+def build_current(mode, digest):
+    """ True if the artifacts of mode exist and were built from digest """
+    try:
+        with open(build_stamp(mode)) as fin:
+            stamp = fin.read().strip()
+    except IOError:
+        return False
+    return stamp == digest and bool(build_artifacts(mode))
+
+
+def xargo_build(modes):
+    """
+    Build the modes whose artifacts are missing or out of date, all at once
+
+    The stamp is only written for builds that succeed, so a failed build is
+    retried on the next run.
+    """
+    digests = {mode: build_hash(mode) for mode in modes}
+    stale = [mode for mode in modes if not build_current(mode, digests[mode])]
+    if debug:
+        print("Debug: build hashes {}, stale {}".format(digests, stale))
+
+    processes = [(mode, subprocess.Popen(xargo_command(mode), shell=True))
+                 for mode in stale]
+    for (mode, process) in processes:
+        if process.wait() != 0:
+            print("Building {} failed with {}".format(mode,
+                                                      process.returncode))
+            continue
+        with open(build_stamp(mode), 'w') as fout:
+            fout.write(digests[mode] + "\n")
+    return digests
 
 
 """ Stub for running KLEE on the LLVM IR """
 
 
-def klee_run():
+def klee_command(interactive=True, klee_args=""):
     global debug
     global original_pwd
 
@@ -648,50 +1199,337 @@ def klee_run():
                 " -v '"
                 + PWD + "/"
                 + klee_out_folder + "':'/mnt'" +
-                " -w /mnt -it afoht/llvm-klee-4 " +
-                "/bin/bash -c 'klee %s'" % bc_file)
+                " -w /mnt " + ("-it " if interactive else "") +
+                "afoht/llvm-klee-4 " +
+                "/bin/bash -c 'klee %s%s'" % (klee_args, bc_file))
     if debug:
         print(klee_cmd)
-    call(klee_cmd, shell=True)
+    return klee_cmd
+
+
+def klee_run():
+    call(klee_command(), shell=True)
+
+
+def klee_start():
+    """ Start KLEE without a terminal and return at once """
+    return subprocess.Popen(klee_command(interactive=False), shell=True,
+                            stdin=subprocess.DEVNULL)
+
+
+def klee_task_run(index, task):
+    """ Explore a single task, into its own klee-out directory """
+    directory = "klee-task-%d-%s" % (index, task)
+    folder = original_pwd + "/" + klee_out_folder
+    """ KLEE refuses to write into an existing output directory """
+    shutil.rmtree(folder + directory, ignore_errors=True)
+    klee_args = "--entry-point=%s --output-dir=%s " % (
+        klee_entry_template.format(task=task), directory)
+    returncode = call(klee_command(interactive=False, klee_args=klee_args),
+                      shell=True, stdin=subprocess.DEVNULL)
+    if returncode != 0:
+        print("KLEE on task {} exited with {}".format(task, returncode))
+    return directory
+
+
+def klee_run_tasks(tasks):
+    """
+    Run KLEE for all tasks concurrently, at most one container per core
+
+    Returns the ktest-files ordered by task, then by test number. The task
+    of each file is recorded in klee_task_dirs, as per task entry points do
+    not make "task" symbolic.
+    """
+    folder = original_pwd + "/" + klee_out_folder
+    workers = max(1, min(os.cpu_count() or 1, len(tasks)))
+    with ThreadPoolExecutor(workers) as executor:
+        directories = list(executor.map(klee_task_run, range(len(tasks)),
+                                        tasks))
+
+    files = []
+    for index, directory in enumerate(directories):
+        if not os.path.isdir(folder + directory):
+            print("No KLEE output for task {}".format(tasks[index]))
+            continue
+        klee_task_dirs[os.path.normpath(folder + directory)] = index
+        files.extend(ktest_listdir(folder, directory))
+    return files
+
+
+def ktest_task_assign(path, record):
+    """ Take the task of a record without one from its klee-out directory """
+    task_to_test, variables = record
+    if task_to_test < 0:
+        task_to_test = klee_task_dirs.get(
+            os.path.normpath(os.path.dirname(path)), task_to_test)
+    return (task_to_test, variables)
+
+
+def ktest_name(path):
+    """
+    The name of a ktest file in the events, qualified with its klee-out
+    directory for per task runs (each of them starts at test000001)
+    """
+    directory = os.path.normpath(os.path.dirname(path))
+    if directory in klee_task_dirs:
+        return os.path.basename(directory) + "/" + os.path.basename(path)
+    return os.path.basename(path)
+
+
+def gdb_cache_init():
+    """
+    Resolve the types and stub functions used in the event loop once
+    """
+    try:
+        gdb_types['u8'] = gdb.lookup_type('u8')
+    except gdb.error:
+        print("Type u8 not found, ceilings are read through parse_and_eval")
+
+    for t in tasks:
+        try:
+            stub_functions[t] = gdb.parse_and_eval("stub_" + t)
+        except gdb.error:
+            print("Function stub_%s not found, called by name" % t)
+
+
+def gdb_ceiling_read():
+    """
+    Read the ceiling argument of the current bkpt
+
+    The ceiling symbol is looked up once per bkpt site (pc), only its value
+    is read on each hit. Raises gdb.error if there is no ceiling.
+    """
+    if 'u8' not in gdb_types:
+        return int(gdb.parse_and_eval("ceiling").cast(gdb.lookup_type('u8')))
+
+    frame = gdb.selected_frame()
+    pc = frame.pc()
+    if pc not in ceiling_symbols:
+        ceiling_symbols[pc] = gdb.lookup_symbol("ceiling", frame.block())[0]
+    symbol = ceiling_symbols[pc]
+    if symbol is None:
+        raise gdb.error("No symbol \"ceiling\" in current context.")
+
+    if symbol.needs_frame:
+        value = symbol.value(frame)
+    else:
+        value = symbol.value()
+    return int(value.cast(gdb_types['u8']))
+
+
+def gdb_task_call(task):
+    """ Call the stub of a task, through the cached function value """
+    if task in stub_functions:
+        stub_functions[task]()
+    else:
+        gdb.execute('call %s' % "stub_" + task + "()")
+
+
+def dwt_read(address):
+    """
+    Read a DWT register, with one binary memory read when possible,
+    otherwise through the OpenOCD monitor
+    """
+    global dwt_memory
+
+    if dwt_memory:
+        try:
+            return struct.unpack('<I', gdb.selected_inferior().read_memory(
+                address, 4))[0]
+        except gdb.error as e:
+            print("DWT memory read failed ({}), using monitor".format(e))
+            dwt_memory = False
+
+    # Reply looks like "0xe0001004: 0000002a "
+    reply = gdb.execute("mon mdw 0x%08x" % address, False, True)
+    return int(reply.split(':', 1)[1].split()[0], 16)
+
+
+def dwt_write(address, value):
+    """
+    Write a DWT register, with one binary memory write when possible,
+    otherwise through the OpenOCD monitor
+    """
+    global dwt_memory
+
+    if dwt_memory:
+        try:
+            gdb.selected_inferior().write_memory(
+                address, struct.pack('<I', value & 0xffffffff))
+            return
+        except gdb.error as e:
+            print("DWT memory write failed ({}), using monitor".format(e))
+            dwt_memory = False
+
+    gdb.execute("mon mww 0x%08x %d" % (address, value & 0xffffffff))
 
 
 def gdb_cyccnt_enable():
     # Enable cyccnt
-    gdb.execute("mon mww 0xe0001000 1")
+    dwt_write(DWT_CTRL, 1)
 
 
 def gdb_cyccnt_disable():
     # Disble cyccnt
-    gdb.execute("mon mww 0xe0001000 0")
+    dwt_write(DWT_CTRL, 0)
 
 
 def gdb_cyccnt_reset():
     # Reset cycle counter to 0
-    gdb.execute("mon mww 0xe0001004 0")
+    dwt_write(DWT_CYCCNT, 0)
 
 
 def gdb_cyccnt_read():
     # Read cycle counter
-    return int(gdb.execute("mon mdw 0xe0001004", False, True).strip(
-        '\n').strip('0xe000012004:').strip(',').strip(), 16)
+    return dwt_read(DWT_CYCCNT)
 
 
 def gdb_cyccnt_write(num):
     # Write to cycle counter
-    gdb.execute('mon mww 0xe0001004 %r' % num)
+    dwt_write(DWT_CYCCNT, num)
 
 
 def gdb_bkpt_read():
-    # Read imm field of the current bkpt
+    # Read imm field of the current bkpt, cached per pc
+    pc = gdb.selected_frame().pc()
+    if pc not in bkpt_imms:
+        try:
+            opcode, = struct.unpack(
+                '<H', gdb.selected_inferior().read_memory(pc, 2))
+            if opcode & 0xff00 == BKPT_OPCODE:
+                bkpt_imms[pc] = opcode & 0x00ff
+            else:
+                bkpt_imms[pc] = 4
+        except gdb.error:
+            bkpt_imms[pc] = gdb_bkpt_disassemble()
+        if debug and bkpt_imms[pc] == 4:
+            print("Debug: It is not a bkpt so return 4")
+
+    return bkpt_imms[pc]
+
+
+def gdb_bkpt_disassemble():
+    # Read imm field of the current bkpt from the disassembly
     try:
         return int(gdb.execute("x/i $pc", False, True).
                    split("bkpt")[1].strip("\t").strip("\n"), 0)
-    except:
-        if debug:
-            print("Debug: It is not a bkpt so return 4")
+    except (IndexError, ValueError, gdb.error):
         return 4
 
 
+""" Section names, file offsets, sizes and flags from the ELF headers """
+ELF_HEADER = struct.Struct('<16sHHIIIIIHHHHHH')
+ELF_SECTION = struct.Struct('<IIIIIIIIII')
+
+
+def elf_sections(path):
+    """
+    Map section name -> (file offset, size, type, flags), for 32 bit little
+    endian ELF
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = ELF_HEADER.unpack_from(data, 0)
+    shoff, shentsize, shnum, shstrndx = (header[6], header[11], header[12],
+                                         header[13])
+    headers = [ELF_SECTION.unpack_from(data, shoff + i * shentsize)
+               for i in range(shnum)]
+    names = headers[shstrndx][4]
+    sections = {}
+    for h in headers:
+        end = data.index(b'\0', names + h[0])
+        sections[data[names + h[0]:end].decode('UTF-8')] = (h[4], h[5],
+                                                            h[1], h[2])
+    return sections
+
+
+SHT_NOBITS = 8
+SHF_ALLOC = 0x2
+
+
+def elf_image_hash(path):
+    """
+    Hash of the sections loaded to the target (name and content), debug
+    info and symbols do not change the measurements
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for name, (offset, size, kind, flags) in sorted(
+                elf_sections(path).items()):
+            if flags & SHF_ALLOC and kind != SHT_NOBITS:
+                f.seek(offset)
+                h.update(name.encode('UTF-8') + b'\0')
+                h.update(hashlib.sha1(f.read(size)).digest())
+    return h.hexdigest()
+
+
+def image_compare():
+    """
+    Compare the sections of the loaded file with the target
+
+    Returns [(section, start, end, matched), ...], None if the target can
+    not compare sections (or the reply is not understood).
+    """
+    try:
+        reply = gdb.execute("compare-sections", False, True)
+    except gdb.error as e:
+        print("compare-sections failed ({})".format(e))
+        return None
+
+    # Lines look like "Section .text, range 0x8000400 -- 0x8001a2c: matched."
+    sections = [(name, int(start, 16), int(end, 16), result == "matched")
+                for (name, start, end, result) in re.findall(
+                    r"Section (\S+), range (0x[0-9a-fA-F]+) -- "
+                    r"(0x[0-9a-fA-F]+): (matched|MIS-MATCHED)", reply)]
+    return sections or None
+
+
+def image_reset():
+    """
+    Reset and halt the core, as after a load, so the run starts from the
+    reset vector with freshly initialized .data and .bss
+    """
+    gdb.execute("monitor reset halt")
+    """ The registers changed behind gdb's back """
+    try:
+        gdb.execute("maintenance flush register-cache")
+    except gdb.error:
+        gdb.execute("flushregs")
+
+
+def image_load(path):
+    """
+    Load the image only where it differs from the target
+
+    Loading is only skipped when compare-sections confirms the target
+    holds the image, the core is then reset instead.
+    """
+    sections = image_compare() if verify_image else None
+    mismatched = [s for s in sections if not s[3]] if sections else None
+
+    if mismatched == []:
+        print("Image %s matches the target, not loading" % path)
+        image_reset()
+    elif mismatched and all(any(lo <= start and end <= hi
+                                for (lo, hi) in ram_regions)
+                            for (name, start, end, matched) in mismatched):
+        """ Only RAM differs, write the sections from the ELF """
+        image_reset()
+        contents = elf_sections(path)
+        inferior = gdb.selected_inferior()
+        with open(path, 'rb') as f:
+            for (name, start, end, matched) in mismatched:
+                offset, size = contents[name][:2]
+                f.seek(offset)
+                inferior.write_memory(start, f.read(min(size, end - start)))
+                print("Wrote section %s to RAM" % name)
+    else:
+        if debug and mismatched:
+            print("Debug: sections differing {}".format(
+                [s[0] for s in mismatched]))
+        gdb.execute("load %s" % path)
+
+
 print("\n\n\nStarting script")
 
 """Used for making GDB scriptable"""
@@ -699,6 +1537,8 @@ gdb.execute("set confirm off")
 gdb.execute("set pagination off")
 gdb.execute("set verbose off")
 gdb.execute("set height 0")
+""" The DWT is outside the memory map reported by OpenOCD """
+gdb.execute("set mem inaccessible-by-default off")
 
 """
 Setup GDB for remote debugging
@@ -715,28 +1555,21 @@ if gdb.progspaces()[0].filename:
     """ A filename was given on the gdb command line """
     example_name = gdb.progspaces()[0].filename.split('/')[-1]
     print("The resource used for debugging: %s" % example_name)
-    try:
-        os.path.exists(gdb.progspaces()[0].filename)
-    except IOError:
-        """ Compiles the given example """
-        xargo_run("stm")
-        xargo_run("klee")
 else:
     example_name = debug_file
     print("Defaulting to example '%s' for debugging." % example_name)
-    try:
-        if example_name not in os.listdir(stm_out_folder):
-            """ Compiles the default example """
-            xargo_run("stm")
-            xargo_run("klee")
-    except IOError:
-        """ Compiles the default example """
-        xargo_run("stm")
-        xargo_run("klee")
+
+""" Build the example for the target and for KLEE, unless up to date """
+if autobuild:
+    xargo_build(["stm", "klee"])
 
 """ Tell GDB to load the file """
 gdb.execute("file %s" % (stm_out_folder + example_name))
-gdb.execute("load %s" % (stm_out_folder + example_name))
+image_load(stm_out_folder + example_name)
+
+""" Measurements are cached per loaded image """
+if measure_cache_enable:
+    measure_image = elf_image_hash(stm_out_folder + example_name)
 
 """ Tell gdb-dashboard to hide """
 # gdb.execute("dashboard -enabled off")
@@ -746,8 +1579,25 @@ gdb.execute("load %s" % (stm_out_folder + example_name))
 gdb_cyccnt_enable()
 gdb_cyccnt_reset()
 
-""" Save all ktest files into an array """
-file_list = ktest_iterate()
+if pipeline:
+    """ Measure the ktest files as KLEE writes them """
+    ktest_pipeline_start()
+else:
+    if klee_parallel:
+        """ Explore the tasks in parallel, in one KLEE each """
+        print("Running KLEE per task, on the entry points %s" % ", ".join(
+            klee_entry_template.format(task=t)
+            for t in tasklist_model(tasklist_get())[0]))
+        file_list = klee_run_tasks(tasklist_model(tasklist_get())[0])
+    else:
+        """ Save all ktest files into an array """
+        file_list = ktest_iterate()
+
+    """ Decode all ktest files before the target is started """
+    if preload:
+        ktest_table = [ktest_task_assign(f, r) for (f, r) in
+                       zip(file_list, ktest_cached_preload(file_list))]
+        print("Preloaded %d ktest files" % len(ktest_table))
 
 """ Get all the tasks to jump to """
 task_list = tasklist_get()
@@ -756,11 +1606,8 @@ if debug:
     print("Debug: file_list {}".format(file_list))
     print("Debug: task_list {}".format(task_list))
 
-""" Split into tasks and priorities """
-for x in task_list:
-    interarrival.append(x.pop())
-    priorities.append(x.pop())
-    tasks.append(x.pop())
+""" Split into tasks, priorities, interarrivals, deadlines and jitter """
+tasks, priorities, interarrival, deadlines, jitter = tasklist_model(task_list)
 
 print("Available tasks:")
 for t in tasks:
@@ -774,6 +1621,13 @@ print("At interarrivals:")
 for t in interarrival:
     print(t)
 
+""" Resolve types and task stubs before the first event """
+gdb_cache_init()
+
+""" Stream the measurements to disk """
+if trace_file is not None:
+    trace_writer = TraceWriter(trace_file)
+
 """ Subscribe stop_event_ignore to Breakpoint notifications """
 gdb.events.stop.connect(stop_event)
 
@@ -0,0 +1,619 @@
+"""
+Response time analysis engines
+
+The task set is given as parallel sequences, C (WCET), B (blocking),
+T (interarrival, also the deadline) and P (priority, higher value is higher
+priority). Tasks of equal priority are ordered as given, an earlier task
+counts as higher priority, as in recursive_response_algorithm.
+
+NumPy is used when it is installed, otherwise the same fixpoint is run in
+plain python. It is only imported on first use, so importing this module
+(and the analysis, and gdb.py) stays fast.
+"""
+from fractions import Fraction
+
+from simulate import hyperperiod
+
+np = None
+numpy_checked = False
+
+
+def _numpy():
+    """ Import NumPy on first use, None if it is not installed """
+    global np
+    global numpy_checked
+
+    if not numpy_checked:
+        numpy_checked = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+    return np
+
+
+def priority_order(P):
+    """ Task indices from highest to lowest priority (stable for ties) """
+    return sorted(range(len(P)), key=lambda i: -P[i])
+
+
+def response_times(C, B, T, P, stop_at_deadline=True, use_numpy=None,
+                   D=None, J=None):
+    """
+    Exact response times under SRP (equation 7.22 of Buttazzo)
+
+    R(0) = C + B, R(s) = C + B + sum over higher priority j of
+    ceil((R(s-1) + J_j) / T_j) * C_j, iterated until a fixpoint or
+    R + J > D. The reported R includes the task's own jitter J, the
+    deadlines D default to T and the jitters to 0.
+
+    Returns (R, I, missed) as lists in the order of the input. With
+    stop_at_deadline R of a missed task is the first value above D,
+    otherwise the iteration continues to the fixpoint (as
+    recursive_response_algorithm does) as long as one exists, i.e. the
+    higher priority utilization is below 1.
+    """
+    D = D if D is not None else T
+    if use_numpy is None:
+        use_numpy = _numpy() is not None
+    if use_numpy:
+        return _response_times_np(C, B, T, P, stop_at_deadline, D, J)
+    return _response_times_py(C, B, T, P, stop_at_deadline, D, J)
+
+
+def _higher_saturated(C, T, order):
+    """
+    For each position in order, whether the tasks before it have a
+    utilization of at least 1 (then the fixpoint does not exist). Summed
+    exactly, as a float sum of e.g. ten 1/10 rounds to just below 1.
+    """
+    saturated = []
+    u_higher = Fraction(0)
+    for i in order:
+        saturated.append(u_higher >= 1)
+        u_higher += Fraction(int(C[i]), int(T[i]))
+    return saturated
+
+
+def _fixpoint(base, r, higher, deadline, stop, jitter=None):
+    """
+    Iterate R = base + sum of ceil(R / T_j) * C_j over higher = [(C_j, T_j)]
+    starting from r (a lower bound of the fixpoint), with jitter (parallel
+    to higher) the windows are ceil((R + J_j) / T_j)
+
+    Returns (R, I, missed, iterations)
+    """
+    missed = False
+    iterations = 0
+    while True:
+        iterations += 1
+        i_time = 0
+        if jitter is None:
+            for (c, t) in higher:
+                i_time += -(-r // t) * c
+        else:
+            for ((c, t), j) in zip(higher, jitter):
+                i_time += -(-(r + j) // t) * c
+        r_next = base + i_time
+        if r_next > deadline:
+            missed = True
+            if stop:
+                return r_next, i_time, missed, iterations
+        if r_next == r:
+            return r, i_time, missed, iterations
+        r = r_next
+
+
+def _response_times_py(C, B, T, P, stop_at_deadline, D, J=None):
+    n = len(C)
+    R = [0] * n
+    I = [0] * n
+    missed = [False] * n
+    higher = []
+    jitter = [] if J is not None else None
+    order = priority_order(P)
+    for i, saturated in zip(order, _higher_saturated(C, T, order)):
+        stop = stop_at_deadline or saturated
+        j = J[i] if J is not None else 0
+        R[i], I[i], missed[i], _ = _fixpoint(C[i] + B[i], C[i] + B[i],
+                                             higher, D[i] - j, stop, jitter)
+        R[i] += j
+        higher.append((C[i], T[i]))
+        if jitter is not None:
+            jitter.append(j)
+    return R, I, missed
+
+
+def _response_times_np(C, B, T, P, stop_at_deadline, D, J=None):
+    """
+    All fixpoints are iterated together, each step computes the
+    interference of every unfinished task as one masked
+    ceil((R + J) / T) * C reduction over its higher priority slice.
+    """
+    _numpy()
+    order = priority_order(P)
+    saturated = np.array(_higher_saturated(C, T, order), dtype=bool)
+    order = np.array(order, dtype=np.intp)
+    n = len(order)
+    dtype = np.result_type(np.asarray(C), np.asarray(B), np.asarray(T))
+    c = np.asarray(C, dtype=dtype)[order]
+    t = np.asarray(T, dtype=dtype)[order]
+    base = c + np.asarray(B, dtype=dtype)[order]
+    j = (np.asarray(J, dtype=dtype)[order] if J is not None
+         else np.zeros(n, dtype=dtype))
+    deadline = np.asarray(D, dtype=dtype)[order] - j
+
+    """ higher[i, j] is set if task j (sorted) interferes with task i """
+    higher = np.tri(n, n, -1, dtype=bool)
+    stop = np.logical_or(stop_at_deadline, saturated)
+    r = base.copy()
+    i_time = np.zeros(n, dtype=dtype)
+    missed = np.zeros(n, dtype=bool)
+    active = np.arange(n)
+    while active.size:
+        jobs = -np.floor_divide(-(r[active, None] + j[None, :]), t[None, :])
+        i_step = (np.where(higher[active], jobs, 0) * c[None, :]).sum(axis=1)
+        r_next = base[active] + i_step
+        i_time[active] = i_step
+        missed[active] |= r_next > deadline[active]
+        done = (missed[active] & stop[active]) | (r_next == r[active])
+        r[active] = r_next
+        active = active[~done]
+
+    R = np.empty(n, dtype=dtype)
+    I = np.empty(n, dtype=dtype)
+    M = np.empty(n, dtype=bool)
+    R[order] = r + j
+    I[order] = i_time
+    M[order] = missed
+    return R.tolist(), I.tolist(), M.tolist()
+
+
+def response_times_batch(C, B, T, P, use_numpy=None):
+    """
+    Response times of one task set under many interarrival vectors
+
+    T is a sequence of interarrival vectors (one per candidate), C, B and P
+    are shared. Returns (R, missed), one list per candidate, each fixpoint
+    stops at the deadline.
+    """
+    if use_numpy is None:
+        use_numpy = _numpy() is not None
+    if not use_numpy:
+        R = []
+        missed = []
+        for t in T:
+            r, _, m = _response_times_py(C, B, t, P, True, t)
+            R.append(r)
+            missed.append(m)
+        return R, missed
+
+    _numpy()
+    order = np.array(priority_order(P), dtype=np.intp)
+    n = len(order)
+    dtype = np.result_type(np.asarray(C), np.asarray(B), np.asarray(T))
+    c = np.asarray(C, dtype=dtype)[order]
+    base = c + np.asarray(B, dtype=dtype)[order]
+    t = np.asarray(T, dtype=dtype).reshape(-1, n)[:, order]
+
+    higher = np.tri(n, n, -1, dtype=bool)
+    r = np.tile(base, (t.shape[0], 1))
+    missed = np.zeros(r.shape, dtype=bool)
+    active = np.ones(r.shape, dtype=bool)
+    while active.any():
+        jobs = -np.floor_divide(-r[:, :, None], t[:, None, :])
+        r_next = base + (np.where(higher, jobs, 0) * c).sum(axis=2)
+        missed |= active & (r_next > t)
+        done = missed | (r_next == r)
+        r = np.where(active, r_next, r)
+        active &= ~done
+
+    R = np.empty(r.shape, dtype=dtype)
+    M = np.empty(r.shape, dtype=bool)
+    R[:, order] = r
+    M[:, order] = missed
+    return R.tolist(), M.tolist()
+
+
+class IncrementalRTA:
+    """
+    Response time analysis for a sequence of nearby task sets
+
+    The last result of every task (identified by name) is remembered
+    together with its parameters and its higher priority set. A task whose
+    (C, B, T) and higher priority tasks (with their C and T) are unchanged
+    reuses its result. Otherwise its fixpoint is restarted, warm started
+    from the old R when that is still a lower bound: the old R met its
+    deadline, C and B did not decrease, and every old higher priority task
+    is still higher priority with a C that did not decrease and a T that
+    did not increase. If the warm started task misses its deadline it is
+    rerun from C + B, so the reported R is the same as response_times.
+
+    The counters reused, warm and cold tell how each task was handled.
+    """
+
+    def __init__(self):
+        self.last = {}
+        self.reused = 0
+        self.warm = 0
+        self.cold = 0
+        self.iterations = 0
+
+    @staticmethod
+    def __lower_bound(old, params, higher):
+        old_params, old_higher = old[0], old[1]
+        if params[0] < old_params[0] or params[1] < old_params[1]:
+            return False
+        for name, (c, t) in old_higher.items():
+            if name not in higher:
+                return False
+            if higher[name][0] < c or higher[name][1] > t:
+                return False
+        return True
+
+    def response_times(self, C, B, T, P, names=None):
+        """
+        Same results as response_times (stopping at the deadline),
+        names identify the tasks between calls (default the index)
+        """
+        if names is None:
+            names = range(len(C))
+        names = list(names)
+        n = len(C)
+        R = [0] * n
+        I = [0] * n
+        missed = [False] * n
+        higher = {}
+        for i in priority_order(P):
+            params = (C[i], B[i], T[i])
+            old = self.last.get(names[i])
+            if old is not None and old[0] == params and old[1] == higher:
+                R[i], I[i], missed[i] = old[2]
+                self.reused += 1
+            else:
+                base = C[i] + B[i]
+                hp = list(higher.values())
+                result = None
+                if (old is not None and not old[2][2] and
+                        self.__lower_bound(old, params, higher)):
+                    result = _fixpoint(base, max(base, old[2][0]), hp,
+                                       T[i], True)
+                    self.iterations += result[3]
+                    self.warm += 1
+                if result is None or result[2]:
+                    """ A miss is reported with the R of a cold start """
+                    result = _fixpoint(base, base, hp, T[i], True)
+                    self.iterations += result[3]
+                    self.cold += 1
+                R[i], I[i], missed[i] = result[:3]
+                self.last[names[i]] = (params, dict(higher),
+                                       (R[i], I[i], missed[i]))
+            higher[names[i]] = (C[i], T[i])
+        return R, I, missed
+
+
+def rate_monotonic(T, P):
+    """ True if priorities are in rate monotonic order (shorter T first) """
+    order = priority_order(P)
+    return all(T[i] <= T[j] for (i, j) in zip(order, order[1:]))
+
+
+""" Stages of prefilter, cheap tests first, in the order they are tried
+
+utilization  U > 1 is rejected
+liu_layland  accepted by the Liu & Layland bound with blocking,
+             sum of C/T up to task k + B_k/T_k <= k(2^(1/k) - 1)
+hyperbolic   accepted by the hyperbolic bound with blocking,
+             prod of (U_j + 1) over higher j * (U_k + B_k/T_k + 1) <= 2
+exact        decided by the response time analysis
+"""
+stages = ('utilization', 'liu_layland', 'hyperbolic', 'exact')
+
+
+def prefilter(C, B, T, P):
+    """
+    Try the cheap stages of the schedulability test on a task set
+
+    Returns (schedulable, stage), schedulable is None if the task set
+    needs the exact test. The two bounds assume rate monotonic priorities
+    and deadline = T, so other priority assignments go straight to the
+    exact test.
+    """
+    if sum(Fraction(int(c), int(t)) for (c, t) in zip(C, T)) > 1:
+        return False, 'utilization'
+
+    if not rate_monotonic(T, P):
+        return None, 'exact'
+
+    U = [c / t for (c, t) in zip(C, T)]
+    order = priority_order(P)
+    u_sum = 0
+    liu_layland = True
+    for k, i in enumerate(order, 1):
+        u_sum += U[i]
+        if u_sum + B[i] / T[i] > k * (2 ** (1 / k) - 1):
+            liu_layland = False
+            break
+    if liu_layland:
+        return True, 'liu_layland'
+
+    product = 1
+    for i in order:
+        if product * (U[i] + B[i] / T[i] + 1) > 2:
+            return None, 'exact'
+        product *= U[i] + 1
+    return True, 'hyperbolic'
+
+
+def _schedulable_from(C, B, T, P, R0):
+    """
+    Exact test with every fixpoint started from R0 (a lower bound, e.g. the
+    response times of the same set with smaller C), returns (ok, R)
+    """
+    R = [0] * len(C)
+    higher = []
+    for i in priority_order(P):
+        base = C[i] + B[i]
+        R[i], _, missed, _ = _fixpoint(base, max(base, R0[i]), higher, T[i],
+                                       True)
+        if missed:
+            return False, R
+        higher.append((C[i], T[i]))
+    return True, R
+
+
+def critical_scaling_factor(C, B, T, P, scale_blocking=True,
+                            precision=1e-4):
+    """
+    Largest factor alpha such that the task set with all C (and B, as
+    critical sections are part of the measured code) scaled by alpha is
+    schedulable
+
+    Binary search between 0 and the utilization bound 1/U, every probe is
+    warm started from the response times of the largest alpha known to be
+    schedulable. Returns (alpha, number of response time analyses).
+    """
+    def scaled(alpha):
+        return ([c * alpha for c in C],
+                [b * alpha for b in B] if scale_blocking else B)
+
+    U = sum(c / t for (c, t) in zip(C, T))
+    if U == 0:
+        return float('inf'), 0
+
+    evaluations = 0
+    lo, R_lo = 0.0, [0] * len(C)
+    hi = 1 / U
+    Cs, Bs = scaled(hi)
+    ok, R = _schedulable_from(Cs, Bs, T, P, R_lo)
+    evaluations += 1
+    if ok:
+        return hi, evaluations
+
+    while hi - lo > precision * hi:
+        mid = (lo + hi) / 2
+        Cs, Bs = scaled(mid)
+        ok, R = _schedulable_from(Cs, Bs, T, P, R_lo)
+        evaluations += 1
+        if ok:
+            lo, R_lo = mid, R
+        else:
+            hi = mid
+    return lo, evaluations
+
+
+def wcet_slack(C, B, T, P):
+    """
+    Largest WCET of each task (in cycles, the other tasks unchanged) that
+    keeps the task set schedulable, None if it is not schedulable as is
+
+    Each task is a binary search over integers between C and the
+    utilization bound, warm started like critical_scaling_factor. The
+    blocking a task causes is kept as measured. Returns (list of max C,
+    number of response time analyses).
+    """
+    ok, R = _schedulable_from(C, B, T, P, [0] * len(C))
+    evaluations = 1
+    if not ok:
+        return [None] * len(C), evaluations
+
+    U = sum(c / t for (c, t) in zip(C, T))
+    max_C = []
+    for k in range(len(C)):
+        lo, R_lo = C[k], R
+        hi = lo + int((1 - U) * T[k]) + 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            Cs = list(C)
+            Cs[k] = mid
+            ok, R_mid = _schedulable_from(Cs, B, T, P, R_lo)
+            evaluations += 1
+            if ok:
+                lo, R_lo = mid, R_mid
+            else:
+                hi = mid
+        max_C.append(lo)
+    return max_C, evaluations
+
+
+def audsley(C, T, blocking):
+    """
+    Optimal priority assignment (Audsley)
+
+    Priorities are assigned from the lowest level up, at each level the
+    first unassigned task that meets its deadline with all other unassigned
+    tasks at higher priority gets it. blocking(i, higher) gives the
+    blocking of task i when exactly the set higher is above it, it may
+    depend on that set but not on the order within it. Tasks with the
+    longest T are tried first.
+
+    Returns (P, number of response time analyses), P gives priorities
+    1..n (n highest) or is None if no assignment is schedulable.
+    """
+    n = len(C)
+    P = [None] * n
+    unassigned = set(range(n))
+    evaluations = 0
+    for level in range(1, n + 1):
+        for i in sorted(unassigned, key=lambda i: (-T[i], i)):
+            higher = unassigned - {i}
+            base = C[i] + blocking(i, higher)
+            _, _, missed, _ = _fixpoint(
+                base, base, [(C[j], T[j]) for j in higher], T[i], True)
+            evaluations += 1
+            if not missed:
+                P[i] = level
+                unassigned.remove(i)
+                break
+        else:
+            return None, evaluations
+    return P, evaluations
+
+
+def busy_period_response_times(C, B, T, P, D=None, J=None):
+    """
+    Exact response times for arbitrary deadlines and release jitter
+
+    For each task the level-i busy period L = B + sum over tasks of
+    priority >= i of ceil((L + J_j) / T_j) * C_j is computed, then the
+    completion of every job q released in it:
+
+    w_q = B + (q + 1) C + sum over higher j of ceil((w_q + J_j) / T_j) C_j
+    R = max over q of w_q - q T + J
+
+    The jobs are checked in order and a task stops at its first response
+    time above D. Returns (R, missed), R is None when the busy period does
+    not end: the utilization of the priority level is above 1, or exactly 1
+    with blocking or jitter in the level.
+    """
+    n = len(C)
+    D = D if D is not None else T
+    J = J if J is not None else [0] * n
+    R = [0] * n
+    missed = [False] * n
+    higher = []
+    u_level = Fraction(0)
+    for i in priority_order(P):
+        hp = [(C[j], T[j], J[j]) for j in higher]
+        higher.append(i)
+        u_level += Fraction(int(C[i]), int(T[i]))
+        if u_level > 1 or (u_level == 1 and (
+                B[i] > 0 or any(J[j] > 0 for j in higher))):
+            R[i], missed[i] = None, True
+            continue
+
+        level = hp + [(C[i], T[i], J[i])]
+        busy = B[i] + sum(c for (c, t, j) in level)
+        while True:
+            busy_next = B[i] + sum(-(-(busy + j) // t) * c
+                                   for (c, t, j) in level)
+            if busy_next == busy:
+                break
+            busy = busy_next
+
+        jobs = -(-(busy + J[i]) // T[i])
+        w = 0
+        for q in range(jobs):
+            w = max(w, B[i] + (q + 1) * C[i])
+            while True:
+                w_next = B[i] + (q + 1) * C[i] + sum(
+                    -(-(w + j) // t) * c for (c, t, j) in hp)
+                if w_next == w:
+                    break
+                w = w_next
+            R[i] = max(R[i], w - q * T[i] + J[i])
+            if R[i] > D[i]:
+                missed[i] = True
+                break
+    return R, missed
+
+
+def qpa(C, T, D=None, J=None, H=None):
+    """
+    Quick Processor-demand Analysis (Zhang & Burns) of the task set under
+    EDF with SRP, deadlines and release jitter
+
+    h(t) = sum over j of (floor((t + J_j - D_j) / T_j) + 1) C_j, counting
+    only jobs with D_j - J_j <= t, plus the blocking b(t), the longest
+    critical section H_j of a task with D_j - J_j > t. The set is
+    schedulable iff h(t) <= t at every absolute deadline below the bound L.
+
+    Below the largest D_j - J_j the blocking term is not monotonic, so
+    those deadlines are all checked. Above it QPA walks down from L and
+    only checks the points h(t) leads to. Returns (schedulable, number of
+    points checked).
+    """
+    n = len(C)
+    D = D if D is not None else T
+    J = J if J is not None else [0] * n
+    H = H if H is not None else [0] * n
+    offsets = [d - j for (d, j) in zip(D, J)]
+
+    def demand(t):
+        h = 0
+        for (c, period, offset) in zip(C, T, offsets):
+            if t >= offset:
+                h += ((t - offset) // period + 1) * c
+        return h
+
+    def blocking(t):
+        return max([h for (h, offset) in zip(H, offsets) if offset > t] +
+                   [0])
+
+    def deadline_before(t):
+        """ Largest absolute deadline strictly below t, None if there is
+            none """
+        d = None
+        for (period, offset) in zip(T, offsets):
+            if offset < t:
+                k = -(-(t - offset) // period) - 1
+                d_j = k * period + offset
+                d = d_j if d is None else max(d, d_j)
+        return d
+
+    U = sum(Fraction(int(c), int(t)) for (c, t) in zip(C, T))
+    if U > 1:
+        return False, 0
+    h_max = max(H + [0])
+
+    if U == 1:
+        """
+        The busy period need not end, but above the largest D_j - J_j the
+        demand grows by exactly one hyperperiod per hyperperiod
+        """
+        L = max(offsets) + hyperperiod(T) + 1
+    else:
+        """ Synchronous busy period (with the longest blocking) """
+        L = h_max + sum(C)
+        while True:
+            L_next = h_max + sum(-(-(L + j) // t) * c
+                                 for (c, t, j) in zip(C, T, J))
+            if L_next == L:
+                break
+            L = L_next
+        L = min(L, max(max(offsets), (sum(
+            (t - d + j) * c / t for (c, t, d, j) in zip(C, T, D, J)) +
+            h_max) / (1 - float(U))))
+
+    points = 0
+    """ Deadlines where blocking still applies, all checked """
+    a = max(offsets)
+    t = deadline_before(min(a, L) + 1)
+    while t is not None and t >= min(offsets):
+        points += 1
+        if demand(t) + blocking(t) > t:
+            return False, points
+        t = deadline_before(t)
+
+    """ QPA above a """
+    t = deadline_before(L)
+    while t is not None and t > a:
+        points += 1
+        h = demand(t)
+        if h > t:
+            return False, points
+        if h <= a:
+            break
+        t = h if h < t else deadline_before(t)
+    return True, points
@@ -0,0 +1,125 @@
+"""
+Discrete-event simulation of the task set under SRP
+
+Every job replays the measured execution of its task as a list of
+segments (duration, level), the level being the priority the task runs at
+during the segment, i.e. its own priority raised to the ceiling of the
+resources it holds. A released job starts when its priority is above the
+level of the running job (the system ceiling, as all jobs share one
+stack), so both preemption and SRP blocking follow from the segments.
+
+Releases are kept in a heap by time and pending jobs in a heap by
+priority, the running and preempted jobs form a stack. The state only
+changes at releases and segment ends, so the time between events is
+skipped.
+"""
+import heapq
+import math
+import random
+
+
+def simulate(segments, T, P, horizon, J=None, seed=None):
+    """
+    Simulate all jobs released before horizon, until they are finished
+
+    segments[i] is the job of task i as a list of (duration, level). With
+    a seed the tasks are released at random offsets in [0, T) and every
+    release is delayed by a random jitter in [0, J], otherwise all tasks
+    are released at 0 (the critical instant without blocking) and J is
+    ignored. The response time of a job is counted from its arrival, i.e.
+    before the jitter.
+
+    Returns (R, jobs), the longest observed response time per task (None
+    if no job finished) and the number of jobs simulated.
+    """
+    n = len(T)
+    J = J if J is not None else [0] * n
+    rng = random.Random(seed) if seed is not None else None
+
+    jitter = rng is not None and any(J)
+    idle = min(P) - 1
+
+    """
+    (release, -priority, arrival, task), arrival is the release without
+    jitter, simultaneous releases come out highest priority first
+    """
+    releases = []
+    for i in range(n):
+        arrival = rng.randrange(T[i]) if rng else 0
+        release = arrival + (rng.randint(0, J[i]) if jitter else 0)
+        if arrival < horizon and segments[i]:
+            releases.append((release, -P[i], arrival, i))
+    heapq.heapify(releases)
+
+    R = [-1] * n
+    jobs = 0
+    ready = []
+    sequence = 0
+    """ Running job on top: [task, segment index, remaining, arrival] """
+    stack = []
+    level = idle
+    now = 0
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+
+    while releases or stack:
+        next_release = releases[0][0] if releases else None
+        if stack:
+            job = stack[-1]
+            end = now + job[2]
+            if next_release is None or end <= next_release:
+                """ The segment on top ends before the next release """
+                now = end
+                task = job[0]
+                index = job[1] + 1
+                job_segments = segments[task]
+                if index < len(job_segments):
+                    job[1] = index
+                    job[2], level = job_segments[index]
+                else:
+                    response = now - job[3]
+                    if response > R[task]:
+                        R[task] = response
+                    jobs += 1
+                    stack.pop()
+                    if stack:
+                        top = stack[-1]
+                        level = segments[top[0]][top[1]][1]
+                    else:
+                        level = idle
+            else:
+                job[2] = end - next_release
+                now = next_release
+        else:
+            now = next_release
+
+        while releases and releases[0][0] <= now:
+            release, priority, arrival, task = heappop(releases)
+            if not ready and -priority > level:
+                """ Starts at once, as it is above the system ceiling """
+                duration, level = segments[task][0]
+                stack.append([task, 0, duration, arrival])
+            else:
+                heappush(ready, (priority, arrival, sequence, task))
+                sequence += 1
+            arrival += T[task]
+            if arrival < horizon:
+                heappush(releases, (
+                    arrival + rng.randint(0, J[task]) if jitter else arrival,
+                    priority, arrival, task))
+
+        """ Dispatch the pending jobs above the system ceiling """
+        while ready and -ready[0][0] > level:
+            _, arrival, _, task = heappop(ready)
+            duration, level = segments[task][0]
+            stack.append([task, 0, duration, arrival])
+
+    return [r if r >= 0 else None for r in R], jobs
+
+
+def hyperperiod(T):
+    """ Least common multiple of the interarrivals """
+    h = 1
+    for t in T:
+        h = h * t // math.gcd(h, t)
+    return h